@@ -1,12 +1,41 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import hashlib
+import heapq
+import hmac
+import csv
+import json
+import logging
+import math
 import os
+import re
+import secrets
+import sqlite3
+import sys
+import tempfile
+import threading
+import xlsxwriter
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from io import BytesIO
-from time import time
-from streamlit.components.v1 import html
-import uuid
+from functools import wraps
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import localtime, perf_counter, sleep, time
+
+try:
+    import fcntl
+except ImportError:  # Windows: o usuarios.csv fica protegido só dentro do processo
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Com copy-on-write os snapshots em cache podem ser compartilhados sem cópia:
+# quem alterar um DataFrame recebido copia só a coluna modificada (padrão no pandas >= 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # ============================================
 # CONFIGURAÇÕES INICIAIS
@@ -15,23 +44,73 @@ import uuid
 if 'persist' not in st.session_state:
     st.session_state.persist = True
 
-# Gera um ID único de sessão se não existir
-if 'session_id' not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
-
-DB_PEDIDOS = "pedidos.csv"
-DB_USUARIOS = "usuarios.csv"
-COLUNAS_PEDIDOS = ["ID", "Pedido", "Funcionário", "Status", "Data Início", "Data Conclusão"]
+# Pasta dos dados, compartilhada por todos os processos do Streamlit no mesmo host
+PASTA_DADOS = os.environ.get("PEDIDOS_PASTA_DADOS", "")
+DB_PEDIDOS = os.path.join(PASTA_DADOS, "pedidos.db")
+DB_PEDIDOS_CSV = os.path.join(PASTA_DADOS, "pedidos.csv")  # formato antigo, migrado uma única vez para o SQLite
+DB_USUARIOS = os.path.join(PASTA_DADOS, "usuarios.csv")
+COLUNAS_PEDIDOS = ["ID", "Pedido", "Funcionário", "Status", "Data Criação", "Data Designação", "Data Início", "Data Conclusão", "Prioridade", "Prazo"]
+# Coluna exibida -> coluna da tabela "pedidos"
+CAMPOS_PEDIDOS = {
+    "ID": "id",
+    "Pedido": "pedido",
+    "Funcionário": "funcionario",
+    "Status": "status",
+    "Data Criação": "data_criacao",
+    "Data Designação": "data_designacao",
+    "Data Início": "data_inicio",
+    "Data Conclusão": "data_conclusao",
+    "Prioridade": "prioridade",
+    "Prazo": "data_prazo"
+}
+COLUNA_VERSAO = "Versão"  # versão da linha, usada no compare-and-swap das edições
 COLUNAS_USUARIOS = ["username", "password", "role", "nome_completo"]
+PARAMETROS_SCRYPT = {"n": 2 ** 14, "r": 8, "p": 1}  # ~16 MB e ~60 ms por hash
+MAX_HASHES_SIMULTANEOS = 4  # logins calculando hash ao mesmo tempo no processo
 TIMEOUT_MINUTOS = 30
+INTERVALO_VARREDURA_SESSOES = 60  # segundos entre varreduras de sessões expiradas
+INTERVALO_TOQUE_SESSAO = 30  # a última atividade só é regravada depois deste tempo
+OPCOES_TAMANHO_PAGINA = [10, 25, 50, 100]
+TAMANHO_PAGINA_PADRAO = 25
+# Rótulo -> cláusula ORDER BY (o id desempata e segue a ordem de criação)
+ORDENACOES_PEDIDOS = {
+    "Mais recentes": "id DESC",
+    "Mais antigos": "id",
+    "Status": "status, id DESC",
+    "Funcionário": "funcionario, id DESC",
+    "Urgência": "prioridade DESC, data_prazo NULLS LAST, id"
+}
+INTERVALO_COMPACTACAO = 300  # segundos entre compactações do registro de eventos
+RETENCAO_EVENTOS_DIAS = 90  # eventos já compactados são mantidos por este período
+TAMANHO_LOTE_EXPORTACAO = 5000  # linhas lidas do banco por vez ao gerar relatórios
+PASTA_RELATORIOS = os.path.join(tempfile.gettempdir(), "relatorios_pedidos")
+PASTA_ARQUIVO = os.path.join(PASTA_DADOS, "arquivo_pedidos")  # concluídos antigos, um Parquet por mês de conclusão
+ATRASO_ARQUIVAMENTO_HORAS = 24  # concluídos ficam no banco por este tempo (>= 2x o timeout)
+DIAS_PERIODO_PADRAO = 30  # período inicial do filtro de concluídos
+# Rótulo -> coluna das datas que a busca pode restringir (a conclusão usa o período)
+DATAS_BUSCA = {"Criação": "data_criacao", "Início": "data_inicio"}
+INTERVALO_NOTIFICACOES = 5  # segundos entre verificações de novos pedidos na tela do funcionário
+MAX_NOTIFICACOES_POR_FUNCIONARIO = 50
+RETENCAO_NOTIFICACOES_MINUTOS = 60  # mensagens mais antigas são apagadas na manutenção
+STATUS_ABERTOS = ("Pendente", "Em andamento", "Pausado")
+INTERVALO_SINCRONIZACAO_MOTOR = 60  # segundos entre recontagens completas das filas
+DURACAO_PADRAO_MINUTOS = 30  # estimativa para quem ainda não concluiu nenhum pedido
+DESIGNACAO_AUTOMATICA = "🤖 Automático (menor fila)"
+FORMATO_DATA = "%d/%m/%Y %H:%M"  # exibição; no banco as datas são segundos desde a época
+FATOR_FAIXA_LEAD = 1.1  # faixas do histograma de lead time crescem 10% cada
+HORAS_PAINEL = 24  # janela de vazão exibida no painel
+# Prioridade (gravada como inteiro, maior = mais urgente) -> rótulo
+PRIORIDADES = {0: "Baixa", 1: "Normal", 2: "Alta", 3: "Urgente"}
+PRIORIDADE_PADRAO = 1
+PRIORIDADE_ESCALADA = 3  # prioridade dada aos pedidos perto do prazo
+PRAZO_PADRAO_HORAS = {0: 168, 1: 72, 2: 24, 3: 4}  # SLA por prioridade, a partir da criação
+ANTECEDENCIA_ESCALONAMENTO_MINUTOS = 60  # pedidos abertos a menos disso do prazo são escalados
+INTERVALO_ESCALONAMENTO = 60  # segundos entre varreduras de prazos
+MAX_PEDIDOS_EM_RISCO = 20  # linhas da lista de prazos no painel
 
 # Variáveis de sessão
-if 'ultimo_pedido' not in st.session_state:
-    st.session_state.ultimo_pedido = None
-if 'notificado' not in st.session_state:
-    st.session_state.notificado = False
-if 'last_activity' not in st.session_state:
-    st.session_state.last_activity = time()
+if 'notificacoes_pendentes' not in st.session_state:
+    st.session_state.notificacoes_pendentes = []
 if 'autenticado' not in st.session_state:
     st.session_state.autenticado = False
 if 'user_info' not in st.session_state:
@@ -45,26 +124,218 @@ CORES_STATUS = {
     "Concluído": "#C8E6C9"
 }
 
+# ============================================
+# RECURSOS DO PROCESSO
+# ============================================
+# O st.cache_resource guarda um objeto por processo entre os reruns, mas cada
+# consulta fora da thread do script (manutenção, escalonamento, relatórios,
+# métricas) registra "missing ScriptRunContext". O objeto obtido fica também
+# neste dicionário, que as threads de fundo leem direto: elas enxergam o
+# módulo do rerun que as iniciou, já preenchido por ele.
+_RECURSOS = {}
+
+def recurso_do_processo(funcao):
+    """Como st.cache_resource (sem argumentos), consultado só uma vez por rerun."""
+    em_cache = st.cache_resource(funcao)
+    
+    @wraps(funcao)
+    def obter():
+        recurso = _RECURSOS.get(funcao.__name__)
+        if recurso is None:
+            recurso = _RECURSOS[funcao.__name__] = em_cache()
+        return recurso
+    
+    def limpar():
+        _RECURSOS.pop(funcao.__name__, None)
+        em_cache.clear()
+    
+    obter.clear = limpar
+    return obter
+
+# ============================================
+# INSTRUMENTAÇÃO
+# ============================================
+# Limites (segundos) das faixas do histograma de tempos, como no Prometheus
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Porta do servidor local de métricas (/metrics e /metrics.json); desligado sem a variável
+PORTA_METRICAS = int(os.environ.get("PEDIDOS_PORTA_METRICAS", "0"))
+INTERVALO_AMOSTRAGEM = 0.005  # segundos entre amostras de pilha do perfilador
+MAX_LINHAS_PERFIL = 20
+
+@recurso_do_processo
+def _tempos():
+    # Tempos por operação, acumulados desde o início do processo
+    return {"lock": threading.Lock(), "operacoes": {}}
+
+def registrar_tempo(operacao, segundos):
+    tempos = _tempos()
+    with tempos["lock"]:
+        medida = tempos["operacoes"].get(operacao)
+        if medida is None:
+            medida = tempos["operacoes"][operacao] = {
+                "quantidade": 0, "soma": 0.0, "maximo": 0.0, "faixas": [0] * len(LIMITES_HISTOGRAMA)
+            }
+        medida["quantidade"] += 1
+        medida["soma"] += segundos
+        medida["maximo"] = max(medida["maximo"], segundos)
+        for posicao, limite in enumerate(LIMITES_HISTOGRAMA):
+            if segundos <= limite:
+                medida["faixas"][posicao] += 1
+                break
+
+def medir(funcao):
+    """Decorador: registra a duração de cada chamada (também quando ela falha)."""
+    @wraps(funcao)
+    def medida(*args, **kwargs):
+        inicio = perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            registrar_tempo(funcao.__name__, perf_counter() - inicio)
+    return medida
+
+# Quadro do invólucro de `medir`, omitido das pilhas do perfilador
+_CODIGO_MEDIDA = medir(lambda: None).__code__
+
+def tempos_operacoes():
+    """{operação: {"quantidade", "soma", "maximo", "faixas"}} (cópia)."""
+    tempos = _tempos()
+    with tempos["lock"]:
+        return {nome: dict(medida, faixas=list(medida["faixas"])) for nome, medida in tempos["operacoes"].items()}
+
+def metricas_prometheus():
+    """Tempos no formato de texto do Prometheus (histograma cumulativo por operação)."""
+    linhas = [
+        "# HELP pedidos_operacao_segundos Duração das operações do sistema de pedidos.",
+        "# TYPE pedidos_operacao_segundos histogram"
+    ]
+    for nome, medida in sorted(tempos_operacoes().items()):
+        acumulado = 0
+        for limite, quantidade in zip(LIMITES_HISTOGRAMA, medida["faixas"]):
+            acumulado += quantidade
+            linhas.append(f'pedidos_operacao_segundos_bucket{{operacao="{nome}",le="{limite}"}} {acumulado}')
+        linhas.append(f'pedidos_operacao_segundos_bucket{{operacao="{nome}",le="+Inf"}} {medida["quantidade"]}')
+        linhas.append(f'pedidos_operacao_segundos_sum{{operacao="{nome}"}} {medida["soma"]:.6f}')
+        linhas.append(f'pedidos_operacao_segundos_count{{operacao="{nome}"}} {medida["quantidade"]}')
+    return "\n".join(linhas) + "\n"
+
+def metricas_json():
+    return json.dumps({"limites": LIMITES_HISTOGRAMA, "operacoes": tempos_operacoes()}, ensure_ascii=False)
+
+class _RequisicaoMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            corpo, tipo = metricas_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            corpo, tipo = metricas_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        dados = corpo.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", tipo + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass
+
+@st.cache_resource
+def iniciar_servidor_metricas():
+    """Servidor HTTP local (127.0.0.1) com /metrics e /metrics.json, se configurado."""
+    if not PORTA_METRICAS:
+        return None
+    try:
+        servidor = ThreadingHTTPServer(("127.0.0.1", PORTA_METRICAS), _RequisicaoMetricas)
+    except OSError:
+        return None  # porta já aberta por outro processo do mesmo host
+
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
+
+def _laco_amostragem(estado):
+    contagens_proprias, contagens_totais = estado["proprias"], estado["totais"]
+    while not estado["parar"].wait(INTERVALO_AMOSTRAGEM):
+        quadro = sys._current_frames().get(estado["thread"])
+        if quadro is None:
+            continue
+        estado["amostras"] += 1
+        vistas = set()
+        proprio = True
+        while quadro is not None:
+            codigo = quadro.f_code
+            if codigo is _CODIGO_MEDIDA:
+                quadro = quadro.f_back
+                continue
+            chave = (codigo.co_name, os.path.basename(codigo.co_filename), codigo.co_firstlineno)
+            if proprio:
+                contagens_proprias[chave] += 1
+                proprio = False
+            if chave not in vistas:
+                vistas.add(chave)
+                contagens_totais[chave] += 1
+            quadro = quadro.f_back
+
+def iniciar_amostragem():
+    """Começa a amostrar a pilha da thread atual (perfilador por amostragem)."""
+    estado = {
+        "thread": threading.get_ident(), "parar": threading.Event(), "amostras": 0,
+        "proprias": Counter(), "totais": Counter(), "inicio": perf_counter()
+    }
+    estado["amostrador"] = threading.Thread(target=_laco_amostragem, args=(estado,), name="perfilador", daemon=True)
+    estado["amostrador"].start()
+    return estado
+
+def parar_amostragem(estado):
+    """Encerra a amostragem; DataFrame com as funções mais presentes nas amostras."""
+    estado["parar"].set()
+    estado["amostrador"].join()
+    total = max(estado["amostras"], 1)
+    linhas = [
+        {
+            "Função": nome,
+            "Arquivo": f"{arquivo}:{linha}",
+            "% total": 100 * quantidade / total,
+            "% própria": 100 * estado["proprias"].get((nome, arquivo, linha), 0) / total
+        }
+        for (nome, arquivo, linha), quantidade in estado["totais"].most_common(MAX_LINHAS_PERFIL)
+    ]
+    return {
+        "duracao": perf_counter() - estado["inicio"],
+        "amostras": estado["amostras"],
+        "funcoes": pd.DataFrame(linhas, columns=["Função", "Arquivo", "% total", "% própria"])
+    }
+
 # ============================================
 # FUNÇÕES DE INICIALIZAÇÃO
 # ============================================
 def inicializar_arquivos():
-    if not os.path.exists(DB_PEDIDOS):
-        pd.DataFrame(columns=COLUNAS_PEDIDOS).to_csv(DB_PEDIDOS, index=False)
+    # As threads iniciadas abaixo usam os recursos já obtidos por este rerun
+    # (ver recurso_do_processo), sem consultar o st.cache_resource
+    for recurso in (_tempos, _conexoes, _cache_dados, _indice_usuarios, _motor_designacao):
+        recurso()
+    iniciar_servidor_metricas()
+    criar_esquema()
+    migrar_pedidos_csv()
+    iniciar_manutencao()
+    iniciar_varredura_sessoes()
+    iniciar_escalonamento()
     
     if not os.path.exists(DB_USUARIOS):
         admin = pd.DataFrame([{
             "username": "admin",
-            "password": hashlib.sha256("admin123".encode()).hexdigest(),
+            "password": gerar_hash_senha("admin123"),
             "role": "lider",
             "nome_completo": "Administrador"
         }])
-        admin.to_csv(DB_USUARIOS, index=False)
+        # Outro processo pode ter criado o arquivo enquanto o hash era calculado
+        alterar_usuarios(lambda df: admin if df.empty else df)
 
 # ============================================
 # FUNÇÕES DE USUÁRIOS
 # ============================================
-def carregar_usuarios():
+def _ler_usuarios():
     try:
         df = pd.read_csv(DB_USUARIOS)
         for col in COLUNAS_USUARIOS:
@@ -74,81 +345,2039 @@ def carregar_usuarios():
     except FileNotFoundError:
         return pd.DataFrame(columns=COLUNAS_USUARIOS)
 
+def versao_usuarios():
+    # O inode muda a cada gravação (arquivo novo + os.replace), inclusive por outro processo
+    try:
+        info = os.stat(DB_USUARIOS)
+        return (info.st_ino, info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return None
+
+@medir
+def carregar_usuarios():
+    return cache_obter(("usuarios",), versao_usuarios(), _ler_usuarios)
+
+# Versão de um índice ainda não montado; None já é a versão do CSV ausente
+_NAO_INDEXADO = object()
+
+@recurso_do_processo
+def _indice_usuarios():
+    # username -> registro e elenco de funcionários, compartilhados pelas sessões
+    # e refeitos quando o CSV muda
+    return {"lock": threading.Lock(), "versao": _NAO_INDEXADO, "registros": {}, "elenco": None}
+
+def _indexar_usuarios(indice, df, versao):
+    indice["registros"] = {str(registro["username"]): registro for registro in df.to_dict("records")}
+    funcionarios = df[df["role"] == "funcionario"].sort_values("nome_completo")
+    chaves = [str(username) for username in funcionarios["username"]]
+    # Os pedidos guardam o username (não muda); o nome completo é só para exibição
+    indice["elenco"] = {
+        "versao": versao,
+        "chaves": chaves,
+        "posicoes": {chave: posicao for posicao, chave in enumerate(chaves)},
+        "nomes": {str(username): nome for username, nome in zip(df["username"], df["nome_completo"])}
+    }
+    indice["versao"] = versao
+
+def _indice_atualizado():
+    indice = _indice_usuarios()
+    versao = versao_usuarios()
+    with indice["lock"]:
+        if indice["versao"] != versao:
+            _indexar_usuarios(indice, _ler_usuarios(), versao)
+        return indice["registros"], indice["elenco"]
+
+def buscar_usuario(username):
+    """Registro do usuário (dict) ou None, sem percorrer a tabela."""
+    return _indice_atualizado()[0].get(username)
+
+def elenco_funcionarios():
+    """Funcionários ordenados por nome: {"versao", "chaves", "posicoes", "nomes"}.
+
+    `chaves` são os usernames (o que os pedidos guardam), `posicoes` dá o índice
+    de cada um em `chaves` e `nomes` leva qualquer username ao nome completo.
+    """
+    return _indice_atualizado()[1]
+
+def nome_funcionario(chave, elenco=None):
+    # Pedidos de usuários removidos continuam mostrando a chave gravada
+    return (elenco or elenco_funcionarios())["nomes"].get(chave, chave)
+
+@contextmanager
+def _trava_usuarios():
+    """Trava o usuarios.csv entre processos (flock) e entre as threads do processo."""
+    indice = _indice_usuarios()
+    with open(DB_USUARIOS + ".trava", "a") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)  # liberada ao fechar o arquivo
+        with indice["lock"]:
+            yield indice
+
+def _gravar_usuarios(indice, df):
+    # Grava ao lado e troca de uma vez: quem lê nunca vê o arquivo pela metade
+    parcial = f"{DB_USUARIOS}.{os.getpid()}.parcial"
+    df.to_csv(parcial, index=False)
+    os.replace(parcial, DB_USUARIOS)
+    _indexar_usuarios(indice, df, versao_usuarios())
+
+@medir
 def salvar_usuarios(df):
-    df.to_csv(DB_USUARIOS, index=False)
+    with _trava_usuarios() as indice:
+        _gravar_usuarios(indice, df)
+    cache_invalidar("usuarios")
+
+@medir
+def alterar_usuarios(alteracao):
+    """Aplica `alteracao(df) -> df` sobre o usuarios.csv atual e grava, sob a trava.
+
+    A leitura é feita dentro da trava, então alterações simultâneas de outros
+    processos não se perdem. Exceções de `alteracao` cancelam a gravação.
+    """
+    with _trava_usuarios() as indice:
+        df = alteracao(_ler_usuarios())
+        _gravar_usuarios(indice, df)
+    cache_invalidar("usuarios")
+    return df
+
+@recurso_do_processo
+def _executor_senhas():
+    # Limita os hashes simultâneos: um pico de logins não toma todas as CPUs
+    return ThreadPoolExecutor(max_workers=MAX_HASHES_SIMULTANEOS, thread_name_prefix="senhas")
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(senha.encode(), salt=sal, n=n, r=r, p=p, maxmem=256 * 1024 * 1024)
+
+def gerar_hash_senha(senha):
+    """Hash no formato "scrypt$n$r$p$sal$hash" (hex), com sal aleatório."""
+    sal = os.urandom(16)
+    parametros = PARAMETROS_SCRYPT
+    calculado = _executor_senhas().submit(_scrypt, senha, sal, parametros["n"], parametros["r"], parametros["p"]).result()
+    return f"scrypt${parametros['n']}${parametros['r']}${parametros['p']}${sal.hex()}${calculado.hex()}"
 
+def conferir_senha(senha, armazenado):
+    """Retorna (confere, precisa_rehash).
+
+    Hashes SHA-256 sem sal (formato antigo) e scrypt com parâmetros diferentes
+    dos atuais conferem normalmente, mas pedem um novo hash. Um valor scrypt
+    malformado (editado à mão no CSV, por exemplo) simplesmente não confere.
+    """
+    armazenado = str(armazenado)
+    if not armazenado.startswith("scrypt$"):
+        calculado = _executor_senhas().submit(lambda: hashlib.sha256(senha.encode()).hexdigest()).result()
+        return hmac.compare_digest(calculado, armazenado), True
+    try:
+        _, n, r, p, sal, esperado = armazenado.split("$")
+        calculado = _executor_senhas().submit(_scrypt, senha, bytes.fromhex(sal), int(n), int(r), int(p)).result()
+    except (ValueError, TypeError, OverflowError):
+        return False, False
+    atuais = (PARAMETROS_SCRYPT["n"], PARAMETROS_SCRYPT["r"], PARAMETROS_SCRYPT["p"])
+    return hmac.compare_digest(calculado.hex(), esperado), (int(n), int(r), int(p)) != atuais
+
+# Conferido quando o usuário não existe, para a resposta levar o mesmo tempo
+_HASH_FICTICIO = "scrypt${n}${r}${p}${sal}${hash}".format(sal="00" * 16, hash="00" * 64, **PARAMETROS_SCRYPT)
+
+def _trocar_hash(username, novo_hash):
+    def trocar(usuarios):
+        usuarios.loc[usuarios["username"].astype(str) == username, "password"] = novo_hash
+        return usuarios
+    alterar_usuarios(trocar)
+
+@medir
 def verificar_login(username, senha):
-    usuarios = carregar_usuarios()
-    usuario = usuarios[usuarios["username"] == username]
-    
-    if not usuario.empty:
-        hashed_pw = hashlib.sha256(senha.encode()).hexdigest()
-        if usuario.iloc[0]["password"] == hashed_pw:
-            st.session_state.last_activity = time()
-            st.session_state.autenticado = True
-            st.session_state.user_info = {
-                "username": username,
-                "role": usuario.iloc[0]["role"],
-                "nome_completo": usuario.iloc[0]["nome_completo"]
-            }
-            return st.session_state.user_info
-    return None
+    usuario = buscar_usuario(username)
+    confere, precisa_rehash = conferir_senha(senha, usuario["password"] if usuario else _HASH_FICTICIO)
+    if usuario is None or not confere:
+        return None
+    
+    if precisa_rehash:
+        _trocar_hash(username, gerar_hash_senha(senha))
+    st.session_state.autenticado = True
+    st.session_state.user_info = {
+        "username": username,
+        "role": usuario["role"],
+        "nome_completo": usuario["nome_completo"]
+    }
+    st.session_state.token_sessao = abrir_sessao(st.session_state.user_info)
+    st.query_params["sessao"] = st.session_state.token_sessao
+    return st.session_state.user_info
 
 # ============================================
-# FUNÇÕES DE PEDIDOS
+# SESSÕES
 # ============================================
-def carregar_pedidos():
+# Sessões ficam na tabela "sessoes" do banco, então qualquer processo atrás do
+# balanceador reconhece o token. A última atividade só é regravada a cada
+# INTERVALO_TOQUE_SESSAO, e a varredura apaga as expiradas pelo índice.
+def _expirar_sessoes(agora=None):
+    limite = (agora or time()) - TIMEOUT_MINUTOS * 60
+    with transacao(alterar_versao=False) as conn:
+        return conn.execute("DELETE FROM sessoes WHERE ultima_atividade < ?", (limite,)).rowcount
+
+def _laco_varredura_sessoes():
+    while True:
+        sleep(INTERVALO_VARREDURA_SESSOES)
+        try:
+            _expirar_sessoes()
+        except Exception:
+            log.exception("Falha na varredura de sessões; nova tentativa na próxima varredura")
+
+@st.cache_resource
+def iniciar_varredura_sessoes():
+    thread = threading.Thread(target=_laco_varredura_sessoes, name="varredura-sessoes", daemon=True)
+    thread.start()
+    return thread
+
+def abrir_sessao(usuario):
+    """Registra uma sessão autenticada e devolve o token que a identifica."""
+    token = secrets.token_urlsafe(24)
+    agora = time()
+    with transacao(alterar_versao=False) as conn:
+        conn.execute(
+            "INSERT INTO sessoes (token, username, role, nome_completo, inicio, ultima_atividade) VALUES (?, ?, ?, ?, ?, ?)",
+            (token, usuario["username"], usuario["role"], usuario["nome_completo"], agora, agora)
+        )
+    return token
+
+def tocar_sessao(token):
+    """Dados do usuário da sessão, renovando a atividade; None se expirou ou não existe."""
+    agora = time()
+    sessao = conectar_banco().execute(
+        "SELECT username, role, nome_completo, ultima_atividade FROM sessoes WHERE token = ?", (token,)
+    ).fetchone()
+    if sessao is None or agora - sessao["ultima_atividade"] > TIMEOUT_MINUTOS * 60:
+        if sessao is not None:
+            encerrar_sessao(token)
+        return None
+    if agora - sessao["ultima_atividade"] > INTERVALO_TOQUE_SESSAO:
+        with transacao(alterar_versao=False) as conn:
+            conn.execute("UPDATE sessoes SET ultima_atividade = ? WHERE token = ?", (agora, token))
+    return {"username": sessao["username"], "role": sessao["role"], "nome_completo": sessao["nome_completo"]}
+
+def retomar_sessao(token):
+    """Troca o token vindo da URL por um novo; devolve (token_novo, usuário) ou (None, None).
+
+    O token antigo deixa de valer na mesma transação, então um link copiado, o
+    histórico do navegador ou um log de proxy só reabrem a sessão uma vez, e
+    quem usar o token primeiro derruba o outro.
+    """
+    agora = time()
+    with transacao(alterar_versao=False) as conn:
+        sessao = conn.execute(
+            "SELECT username, role, nome_completo, inicio, ultima_atividade FROM sessoes WHERE token = ?", (token,)
+        ).fetchone()
+        if sessao is None:
+            return None, None
+        conn.execute("DELETE FROM sessoes WHERE token = ?", (token,))
+        if agora - sessao["ultima_atividade"] > TIMEOUT_MINUTOS * 60:
+            return None, None
+        novo = secrets.token_urlsafe(24)
+        conn.execute(
+            "INSERT INTO sessoes (token, username, role, nome_completo, inicio, ultima_atividade) VALUES (?, ?, ?, ?, ?, ?)",
+            (novo, sessao["username"], sessao["role"], sessao["nome_completo"], sessao["inicio"], agora)
+        )
+    return novo, {"username": sessao["username"], "role": sessao["role"], "nome_completo": sessao["nome_completo"]}
+
+def encerrar_sessao(token):
+    with transacao(alterar_versao=False) as conn:
+        conn.execute("DELETE FROM sessoes WHERE token = ?", (token,))
+
+def usuarios_ativos():
+    """(usuários distintos, sessões) com atividade dentro do timeout, em todos os processos."""
+    return tuple(conectar_banco().execute(
+        "SELECT COUNT(DISTINCT username), COUNT(*) FROM sessoes WHERE ultima_atividade >= ?",
+        (time() - TIMEOUT_MINUTOS * 60,)
+    ).fetchone())
+
+# ============================================
+# ARMAZENAMENTO DE PEDIDOS (SQLite)
+# ============================================
+@recurso_do_processo
+def _conexoes():
+    # Uma conexão por thread; o objeto sobrevive aos reruns do Streamlit
+    return threading.local()
+
+def conectar_banco():
+    local = _conexoes()
+    conn = getattr(local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PEDIDOS, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        local.conn = conn
+    return conn
+
+@contextmanager
+def transacao(alterar_versao=True):
+    """Abre uma transação de escrita (BEGIN IMMEDIATE) e faz commit/rollback ao sair.
+
+    Com `alterar_versao=False` (manutenção interna) o contador de versão não muda
+    e os snapshots em cache continuam válidos.
+    """
+    conn = conectar_banco()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if alterar_versao:
+            _alterar_versao(conn)
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _alterar_versao(conn):
+    """Avança a versão dentro de uma transação aberta com `alterar_versao=False`.
+
+    Para escritas que só sabem se vão gravar algo depois de reler dentro da trava.
+    A versão nova já vale dentro da transação (ver VERSAO_ATUAL_SQL) e fica
+    anotada na thread para o motor de designação (ver motor_registrar_alteracoes).
+    """
+    _conexoes().versao_escrita = conn.execute(
+        "UPDATE versao SET valor = valor + 1 WHERE id = 1 RETURNING valor"
+    ).fetchone()[0]
+
+# Usado nas escritas para marcar a linha com a versão da transação corrente
+VERSAO_ATUAL_SQL = "(SELECT valor FROM versao WHERE id = 1)"
+
+def _comandos_sql(script):
+    """Separa um script SQL em comandos completos (para rodar um a um numa transação)."""
+    comandos, atual = [], ""
+    for trecho in script.split(";"):
+        atual += trecho + ";"
+        if sqlite3.complete_statement(atual):
+            if atual.strip(" \n;"):
+                comandos.append(atual)
+            atual = ""
+    return comandos
+
+def _migrar(conn, versao, script, depois=None):
+    """Aplica um passo do esquema e marca `versao` em user_version, numa transação.
+
+    A versão é relida já com a trava de escrita (BEGIN IMMEDIATE): com vários
+    processos subindo juntos, só o primeiro aplica o passo e os demais o
+    encontram pronto. Retorna o resultado de `depois(conn)`, ou None se o passo
+    já estava aplicado.
+    """
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        df = pd.read_csv(DB_PEDIDOS)
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= versao:
+            conn.execute("ROLLBACK")
+            return None
+        for comando in _comandos_sql(script):
+            conn.execute(comando)
+        resultado = depois(conn) if depois else None
+        conn.execute(f"PRAGMA user_version = {int(versao)}")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return resultado
+
+def criar_esquema():
+    conn = conectar_banco()
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if versao < 1:
+        _migrar(conn, 1, """
+            CREATE TABLE IF NOT EXISTS pedidos (
+                id INTEGER PRIMARY KEY,
+                pedido INTEGER NOT NULL,
+                funcionario TEXT,
+                status TEXT NOT NULL,
+                data_criacao TEXT,
+                data_designacao TEXT,
+                data_inicio TEXT,
+                data_conclusao TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_pedidos_funcionario ON pedidos (funcionario, status);
+            CREATE INDEX IF NOT EXISTS idx_pedidos_status ON pedidos (status);
+            CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+        """)
+    if versao < 2:
+        # Contador global incrementado a cada escrita; chave do cache de leituras
+        _migrar(conn, 2, """
+            CREATE TABLE IF NOT EXISTS versao (id INTEGER PRIMARY KEY CHECK (id = 1), valor INTEGER NOT NULL);
+            INSERT OR IGNORE INTO versao (id, valor) VALUES (1, 0);
+        """)
+    if versao < 3:
+        # Registro de eventos (somente inserção) e snapshot compactado por pedido
+        _migrar(conn, 3, """
+            CREATE TABLE IF NOT EXISTS eventos (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_pedido INTEGER NOT NULL,
+                tipo TEXT NOT NULL,
+                status TEXT,
+                funcionario TEXT,
+                momento REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_eventos_pedido ON eventos (id_pedido, seq);
+            CREATE TABLE IF NOT EXISTS snapshot_pedidos (
+                id_pedido INTEGER PRIMARY KEY,
+                status TEXT,
+                funcionario TEXT,
+                segundos_trabalhados REAL NOT NULL DEFAULT 0,
+                inicio_trecho REAL,
+                excluido INTEGER NOT NULL DEFAULT 0
+            );
+            INSERT OR IGNORE INTO meta (chave, valor) VALUES ('seq_snapshot', '0');
+        """)
+    if versao < 4:
+        # Versão da última alteração de cada linha e saídas (exclusão/redesignação)
+        # por funcionário, para a atualização incremental da fila de cada um
+        _migrar(conn, 4, """
+            ALTER TABLE pedidos ADD COLUMN versao_alteracao INTEGER NOT NULL DEFAULT 0;
+            CREATE INDEX IF NOT EXISTS idx_pedidos_funcionario_versao ON pedidos (funcionario, versao_alteracao);
+            CREATE TABLE IF NOT EXISTS saidas_pedidos (
+                funcionario TEXT NOT NULL,
+                id_pedido INTEGER NOT NULL,
+                versao INTEGER NOT NULL,
+                momento REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_saidas_funcionario ON saidas_pedidos (funcionario, versao);
+        """)
+    if versao < 5:
+        # Consulta de números de pedido já existentes na importação em lote
+        _migrar(conn, 5, """
+            CREATE INDEX IF NOT EXISTS idx_pedidos_pedido ON pedidos (pedido);
+        """)
+    if versao < 6:
+        # Datas passam a ser epoch (REAL) e ganham agregados mantidos a cada escrita
+        conn.create_function("data_para_epoch", 1, _data_legada_para_epoch)
+        _migrar(conn, 6, """
+            CREATE TABLE pedidos_v6 (
+                id INTEGER PRIMARY KEY,
+                pedido INTEGER NOT NULL,
+                funcionario TEXT,
+                status TEXT NOT NULL,
+                data_criacao REAL,
+                data_designacao REAL,
+                data_inicio REAL,
+                data_conclusao REAL,
+                versao_alteracao INTEGER NOT NULL DEFAULT 0
+            );
+            INSERT INTO pedidos_v6
+                SELECT id, pedido, funcionario, status,
+                       data_para_epoch(data_criacao), data_para_epoch(data_designacao),
+                       data_para_epoch(data_inicio), data_para_epoch(data_conclusao),
+                       versao_alteracao
+                FROM pedidos;
+            DROP TABLE pedidos;
+            ALTER TABLE pedidos_v6 RENAME TO pedidos;
+            CREATE INDEX idx_pedidos_funcionario ON pedidos (funcionario, status);
+            CREATE INDEX idx_pedidos_status ON pedidos (status);
+            CREATE INDEX idx_pedidos_funcionario_versao ON pedidos (funcionario, versao_alteracao);
+            CREATE INDEX idx_pedidos_pedido ON pedidos (pedido);
+            CREATE TABLE IF NOT EXISTS metricas_contagem (
+                funcionario TEXT NOT NULL,
+                status TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (funcionario, status)
+            );
+            CREATE TABLE IF NOT EXISTS metricas_hora (
+                hora INTEGER PRIMARY KEY,
+                concluidos INTEGER NOT NULL,
+                com_lead INTEGER NOT NULL,
+                soma_lead REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS metricas_lead (
+                faixa INTEGER PRIMARY KEY,
+                quantidade INTEGER NOT NULL,
+                soma REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS metricas_funcionario (
+                funcionario TEXT PRIMARY KEY,
+                concluidos INTEGER NOT NULL,
+                soma_lead REAL NOT NULL
+            );
+        """, recalcular_metricas)
+    if versao < 7:
+        # Pedidos passam a guardar o username do funcionário em vez do nome completo
+        mapa = _migrar(conn, 7, "UPDATE versao SET valor = valor + 1 WHERE id = 1;", _migrar_nomes_para_username)
+        _migrar_nomes_arquivo(mapa)
+    if versao < 8:
+        # Índices das buscas por intervalo de datas (o de número já existe desde a v5)
+        _migrar(conn, 8, """
+            CREATE INDEX IF NOT EXISTS idx_pedidos_criacao ON pedidos (data_criacao);
+            CREATE INDEX IF NOT EXISTS idx_pedidos_inicio ON pedidos (data_inicio);
+            CREATE INDEX IF NOT EXISTS idx_pedidos_conclusao ON pedidos (data_conclusao);
+        """)
+    if versao < 9:
+        # Sessões e notificações saem da memória do processo para o banco compartilhado
+        _migrar(conn, 9, """
+            CREATE TABLE IF NOT EXISTS sessoes (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                role TEXT NOT NULL,
+                nome_completo TEXT,
+                inicio REAL NOT NULL,
+                ultima_atividade REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessoes_atividade ON sessoes (ultima_atividade);
+            CREATE TABLE IF NOT EXISTS notificacoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                funcionario TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                id_pedido INTEGER NOT NULL,
+                numero INTEGER,
+                momento REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_notificacoes_funcionario ON notificacoes (funcionario, seq);
+        """)
+    if versao < 10:
+        # Prioridade e prazo (SLA); os abertos existentes ganham o prazo padrão. O
+        # backlog cujo prazo herdado já venceu (ou está na antecedência) sai marcado
+        # como escalado: a primeira varredura não sobe nem notifica pedido a pedido
+        agora = time()
+        _migrar(conn, 10, f"""
+            ALTER TABLE pedidos ADD COLUMN prioridade INTEGER NOT NULL DEFAULT {PRIORIDADE_PADRAO};
+            ALTER TABLE pedidos ADD COLUMN data_prazo REAL;
+            ALTER TABLE pedidos ADD COLUMN escalado REAL;
+            UPDATE pedidos SET data_prazo = COALESCE(data_criacao, {agora}) + {PRAZO_PADRAO_HORAS[PRIORIDADE_PADRAO] * 3600}
+                WHERE status != 'Concluído';
+            UPDATE pedidos SET escalado = {agora}
+                WHERE status != 'Concluído' AND data_prazo <= {agora + ANTECEDENCIA_ESCALONAMENTO_MINUTOS * 60};
+            -- Fila de cada funcionário já na ordem de urgência, e a varredura de prazos
+            CREATE INDEX IF NOT EXISTS idx_pedidos_fila ON pedidos (funcionario, prioridade DESC, data_prazo)
+                WHERE status != 'Concluído';
+            CREATE INDEX IF NOT EXISTS idx_pedidos_prazo_abertos ON pedidos (data_prazo)
+                WHERE status != 'Concluído';
+        """)
+    if versao < 11:
+        # IDs nunca são reaproveitados: eventos, snapshot e arquivo são indexados por ID
+        _migrar(conn, 11, """
+            CREATE TABLE pedidos_v11 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pedido INTEGER NOT NULL,
+                funcionario TEXT,
+                status TEXT NOT NULL,
+                data_criacao REAL,
+                data_designacao REAL,
+                data_inicio REAL,
+                data_conclusao REAL,
+                versao_alteracao INTEGER NOT NULL DEFAULT 0,
+                prioridade INTEGER NOT NULL DEFAULT 1,
+                data_prazo REAL,
+                escalado REAL
+            );
+            INSERT INTO pedidos_v11
+                SELECT id, pedido, funcionario, status, data_criacao, data_designacao, data_inicio,
+                       data_conclusao, versao_alteracao, prioridade, data_prazo, escalado
+                FROM pedidos;
+            DROP TABLE pedidos;
+            ALTER TABLE pedidos_v11 RENAME TO pedidos;
+            CREATE INDEX idx_pedidos_funcionario ON pedidos (funcionario, status);
+            CREATE INDEX idx_pedidos_status ON pedidos (status);
+            CREATE INDEX idx_pedidos_funcionario_versao ON pedidos (funcionario, versao_alteracao);
+            CREATE INDEX idx_pedidos_pedido ON pedidos (pedido);
+            CREATE INDEX idx_pedidos_criacao ON pedidos (data_criacao);
+            CREATE INDEX idx_pedidos_inicio ON pedidos (data_inicio);
+            CREATE INDEX idx_pedidos_conclusao ON pedidos (data_conclusao);
+            CREATE INDEX idx_pedidos_fila ON pedidos (funcionario, prioridade DESC, data_prazo)
+                WHERE status != 'Concluído';
+            CREATE INDEX idx_pedidos_prazo_abertos ON pedidos (data_prazo)
+                WHERE status != 'Concluído';
+        """, _semear_sequencia_pedidos)
+
+def _semear_sequencia_pedidos(conn):
+    # Maior ID já usado: no banco, no histórico (inclui excluídos) ou no arquivo
+    maior = conn.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM pedidos), 0), "
+        "COALESCE((SELECT MAX(id_pedido) FROM eventos), 0), "
+        "COALESCE((SELECT MAX(id_pedido) FROM snapshot_pedidos), 0))"
+    ).fetchone()[0]
+    for caminho in particoes_arquivo():
+        ids = pd.read_parquet(caminho, columns=["id"])["id"]
+        if len(ids):
+            maior = max(maior, int(ids.max()))
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'pedidos'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('pedidos', ?)", (maior,))
+
+def _mapa_nomes_usuarios():
+    usuarios = _ler_usuarios()
+    mapa = {}
+    for username, nome in zip(usuarios["username"], usuarios["nome_completo"]):
+        if isinstance(nome, str) and nome != str(username):
+            mapa.setdefault(nome, str(username))
+    return mapa
+
+def _migrar_nomes_para_username(conn):
+    mapa = _mapa_nomes_usuarios()
+    if not mapa:
+        return mapa
+    conn.execute("CREATE TEMP TABLE mapa_nomes (nome TEXT PRIMARY KEY, username TEXT NOT NULL)")
+    conn.executemany("INSERT INTO mapa_nomes VALUES (?, ?)", mapa.items())
+    for tabela in ("pedidos", "eventos", "snapshot_pedidos", "saidas_pedidos"):
+        conn.execute(
+            f"UPDATE {tabela} SET funcionario = (SELECT username FROM mapa_nomes WHERE nome = funcionario) "
+            "WHERE funcionario IN (SELECT nome FROM mapa_nomes)"
+        )
+    # Agregados: soma no username (pode já existir) e remove a linha do nome
+    conn.execute(
+        "INSERT INTO metricas_contagem (funcionario, status, quantidade) "
+        "SELECT m.username, c.status, c.quantidade FROM metricas_contagem c JOIN mapa_nomes m ON m.nome = c.funcionario WHERE true "
+        "ON CONFLICT (funcionario, status) DO UPDATE SET quantidade = quantidade + excluded.quantidade"
+    )
+    conn.execute(
+        "INSERT INTO metricas_funcionario (funcionario, concluidos, soma_lead) "
+        "SELECT m.username, f.concluidos, f.soma_lead FROM metricas_funcionario f JOIN mapa_nomes m ON m.nome = f.funcionario WHERE true "
+        "ON CONFLICT (funcionario) DO UPDATE SET concluidos = concluidos + excluded.concluidos, soma_lead = soma_lead + excluded.soma_lead"
+    )
+    for tabela in ("metricas_contagem", "metricas_funcionario"):
+        conn.execute(f"DELETE FROM {tabela} WHERE funcionario IN (SELECT nome FROM mapa_nomes)")
+    conn.execute("DROP TABLE mapa_nomes")
+    return mapa
+
+def _migrar_nomes_arquivo(mapa):
+    if not mapa:
+        return
+    for caminho in particoes_arquivo():
+        df = pd.read_parquet(caminho)
+        df["funcionario"] = df["funcionario"].map(lambda nome: mapa.get(nome, nome))
+        parcial = caminho + ".parcial"
+        df.to_parquet(parcial, index=False)
+        os.replace(parcial, caminho)
+
+def versao_pedidos():
+    return conectar_banco().execute("SELECT valor FROM versao WHERE id = 1").fetchone()[0]
+
+def intervalo_datas(datas):
+    """(início, fim) em epoch cobrindo os dias inteiros de um par de `date`."""
+    return (
+        datetime.combine(datas[0], datetime.min.time()).timestamp(),
+        datetime.combine(datas[1], datetime.max.time()).timestamp()
+    )
+
+def data_para_epoch(valor):
+    """Segundos desde a época para uma data em FORMATO_DATA, datetime local ou número."""
+    if valor is None or valor == "" or (isinstance(valor, float) and math.isnan(valor)) or valor is pd.NaT:
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    if isinstance(valor, pd.Timestamp):
+        # Timestamp sem fuso é tratado como UTC; o datetime nativo, como horário local
+        valor = valor.to_pydatetime()
+    if isinstance(valor, datetime):
+        return valor.timestamp()
+    return datetime.strptime(valor, FORMATO_DATA).timestamp()
+
+# Tipos do DataFrame de pedidos, aplicados ao ler do banco e ao gravar
+CATEGORIAS_STATUS = pd.CategoricalDtype(list(CORES_STATUS))
+MAX_INT32 = 2 ** 31 - 1
+MAX_PEDIDO = 2 ** 63 - 1  # números de pedido são int64 (o INTEGER do SQLite)
+COLUNAS_DATA = [coluna for coluna, campo in CAMPOS_PEDIDOS.items() if campo.startswith("data_")]
+
+def _deslocamentos_fuso(segundos):
+    """Deslocamento do horário local (s) vigente em cada instante, com horário de verão.
+
+    As mudanças de fuso caem em hora cheia: basta consultar o fuso uma vez por
+    hora distinta em vez de uma vez por linha.
+    """
+    horas, posicoes = np.unique(np.floor(segundos / 3600), return_inverse=True)
+    deslocamentos = np.array([localtime(hora * 3600).tm_gmtoff for hora in horas], dtype="float64")
+    return deslocamentos[posicoes.reshape(-1)]
+
+def _coluna_data(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_numeric_dtype(serie):
+        # Epoch do banco -> horário local sem fuso, como o usuário vê (direto no numpy)
+        segundos = serie.to_numpy(dtype="float64")
+        nulos = np.isnan(segundos)
+        segundos = np.where(nulos, 0, segundos)
+        nanos = np.rint((segundos + _deslocamentos_fuso(segundos)) * 1e9).astype("int64")
+        datas = nanos.view("datetime64[ns]")
+        datas[nulos] = np.datetime64("NaT")
+        return datas
+    texto = serie.astype(object).where(serie.notna() & (serie.astype(str) != ""), None)
+    return pd.to_datetime(texto, format=FORMATO_DATA).to_numpy(dtype="datetime64[ns]")
+
+def aplicar_esquema_pedidos(df):
+    """DataFrame de pedidos com os tipos fixos: ID int32, Pedido int64, Status e
+    Funcionário categóricos, Prioridade int8 (vazia = PRIORIDADE_PADRAO) e
+    datas datetime64 (NaT quando vazias).
+
+    Levanta ValueError para números fora do intervalo, status fora de
+    CORES_STATUS ou datas ilegíveis.
+    """
+    colunas = {}
+    for coluna, maximo, tipo in (("ID", MAX_INT32, "int32"), ("Pedido", MAX_PEDIDO, "int64")):
+        valores = pd.to_numeric(df[coluna]).to_numpy()
+        if len(valores) and (valores.min() < 0 or valores.max() > maximo):
+            raise ValueError(f"{coluna} fora do intervalo de {tipo}")
+        colunas[coluna] = valores.astype(tipo)
+    status = pd.Categorical(df["Status"], dtype=CATEGORIAS_STATUS)
+    invalidos = (status.codes == -1) & df["Status"].notna().to_numpy()
+    if invalidos.any():
+        raise ValueError(f"Status inválido: {df['Status'].to_numpy()[invalidos][0]!r}")
+    colunas["Status"] = status
+    colunas["Funcionário"] = pd.Categorical(df["Funcionário"])
+    prioridade = pd.to_numeric(df["Prioridade"], errors="coerce").fillna(PRIORIDADE_PADRAO)
+    colunas["Prioridade"] = prioridade.to_numpy().astype("int8")
+    for coluna in COLUNAS_DATA:
+        colunas[coluna] = _coluna_data(df[coluna])
+    if COLUNA_VERSAO in df.columns:
+        colunas[COLUNA_VERSAO] = df[COLUNA_VERSAO].to_numpy(dtype="int64")
+    return pd.DataFrame(colunas, index=df.index)[[c for c in df.columns if c in colunas]]
+
+def formatar_datas(serie):
+    """Datas de uma coluna do esquema como texto em FORMATO_DATA ("" quando vazias)."""
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.fillna("").astype(str)
+    return serie.dt.strftime(FORMATO_DATA).fillna("")
+
+def _data_legada_para_epoch(valor):
+    # Na migração, datas ilegíveis gravadas pela versão em CSV viram nulas
+    try:
+        return data_para_epoch(valor)
+    except ValueError:
+        return None
+
+# Colunas de exibição lidas do banco, com as datas já formatadas pelo SQLite
+COLUNAS_SELECT_PEDIDOS = ", ".join(
+    f"strftime('{FORMATO_DATA}', {campo}, 'unixepoch', 'localtime')" if campo.startswith("data_") else campo
+    for campo in CAMPOS_PEDIDOS.values()
+)
+
+def _linha_para_valores(linha):
+    valores = []
+    for col in COLUNAS_PEDIDOS:
+        valor = linha.get(col)
+        if pd.isna(valor) or valor == "":
+            valor = PRIORIDADE_PADRAO if col == "Prioridade" else None
+        elif col in ("ID", "Pedido", "Prioridade"):
+            valor = int(valor)
+        elif col in COLUNAS_DATA:
+            valor = data_para_epoch(valor)
+        else:
+            valor = str(valor)
+        valores.append(valor)
+    return valores
+
+def _separar_pedidos_legados(df):
+    """Separa as linhas do CSV antigo que o esquema atual não aceita.
+
+    Datas ilegíveis viram vazias; ID fora do int32, número de pedido fora do
+    int64 e status vazio ou desconhecido rejeitam a linha.
+    Retorna (aceitas, rejeitadas com a coluna "Motivo").
+    """
+    motivos = np.full(len(df), "", dtype=object)
+    for coluna, maximo in (("ID", MAX_INT32), ("Pedido", MAX_PEDIDO)):
+        validos = np.array([valor.strip().isdigit() and int(valor) <= maximo for valor in df[coluna]], dtype=bool)
+        motivos[~validos & (motivos == "")] = f"{coluna} inválido"
+    motivos[~df["Status"].isin(list(CORES_STATUS)).to_numpy() & (motivos == "")] = "Status inválido"
+    df = df.copy()
+    for coluna in COLUNAS_DATA:
+        ilegiveis = pd.to_datetime(df[coluna], format=FORMATO_DATA, errors="coerce").isna()
+        df.loc[ilegiveis, coluna] = ""
+    rejeitadas = motivos != ""
+    return df[~rejeitadas], df[rejeitadas].assign(Motivo=motivos[rejeitadas])
+
+def migrar_pedidos_csv(caminho=DB_PEDIDOS_CSV):
+    """Importa o pedidos.csv antigo para o SQLite (executa uma única vez)."""
+    conn = conectar_banco()
+    if conn.execute("SELECT 1 FROM meta WHERE chave = 'migracao_csv'").fetchone():
+        return 0
+    
+    total = 0
+    if os.path.exists(caminho):
+        df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+        # Arquivos antigos guardavam a criação em "Data"; os mais novos gravavam
+        # a criação em "Data Início" enquanto o pedido estava pendente
+        if "Data" in df.columns:
+            df = df.rename(columns={"Data": "Data Criação"})
+        elif "Data Início" in df.columns and "Status" in df.columns:
+            pendentes = df["Status"] == "Pendente"
+            df["Data Criação"] = df["Data Início"].where(pendentes, "")
+            df.loc[pendentes, "Data Início"] = ""
         for col in COLUNAS_PEDIDOS:
             if col not in df.columns:
                 df[col] = ""
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=COLUNAS_PEDIDOS)
+        df = df[df["ID"] != ""]
+        # Linhas que o esquema recusaria ficam num CSV ao lado, para correção
+        # manual; sem isso a migração falharia a cada inicialização
+        df, rejeitadas = _separar_pedidos_legados(df)
+        if not rejeitadas.empty:
+            caminho_rejeitadas = os.path.splitext(caminho)[0] + "_rejeitados.csv"
+            rejeitadas.to_csv(caminho_rejeitadas, index=False)
+            log.warning("%d pedido(s) do CSV antigo não foram migrados; veja %s", len(rejeitadas), caminho_rejeitadas)
+        mapa = _mapa_nomes_usuarios()
+        df["Funcionário"] = df["Funcionário"].map(lambda nome: mapa.get(nome, nome))
+        total = salvar_pedidos(df)
+    
+    with transacao() as conn:
+        # Como na migração v10: o backlog cujo prazo padrão já venceu não é
+        # escalado (nem notificado) pedido a pedido na primeira varredura
+        agora = time()
+        conn.execute(
+            "UPDATE pedidos SET escalado = ? WHERE escalado IS NULL AND status != 'Concluído' AND data_prazo <= ?",
+            (agora, agora + ANTECEDENCIA_ESCALONAMENTO_MINUTOS * 60)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('migracao_csv', ?)",
+            (datetime.now().strftime(FORMATO_DATA),)
+        )
+    return total
 
-def salvar_pedidos(df):
-    df.to_csv(DB_PEDIDOS, index=False)
-
-def adicionar_pedido(num_pedido, funcionario):
-    df = carregar_pedidos()
-    novo_id = df["ID"].max() + 1 if not df.empty else 1
-    novo_pedido = pd.DataFrame([[
-        novo_id,
-        num_pedido,
-        funcionario,
-        "Pendente",
-        datetime.now().strftime("%d/%m/%Y %H:%M"),
-        ""
-    ]], columns=COLUNAS_PEDIDOS)
-    df = pd.concat([df, novo_pedido], ignore_index=True)
-    salvar_pedidos(df)
-    
-    st.session_state.ultimo_pedido = {
-        "numero": num_pedido,
-        "funcionario": funcionario,
-        "timestamp": time()
+# ============================================
+# CACHE DE DADOS
+# ============================================
+@recurso_do_processo
+def _cache_dados():
+    # Compartilhado por todas as sessões do processo; "cartoes" é o LRU de
+    # HTML de cartões, por conteúdo da linha (ver gerar_cartoes_html)
+    return {"lock": threading.Lock(), "entradas": {}, "cartoes": OrderedDict(), "acertos": 0, "falhas": 0}
+
+def cache_obter(chave, versao, carregar):
+    """Devolve o snapshot de `chave` se ainda estiver na `versao`; senão recarrega.
+
+    O DataFrame devolvido é uma cópia rasa do snapshot em cache; com copy-on-write,
+    alterações feitas por quem chamou não afetam as outras sessões.
+    """
+    cache = _cache_dados()
+    with cache["lock"]:
+        entrada = cache["entradas"].get(chave)
+        if entrada is not None and entrada[0] == versao:
+            cache["acertos"] += 1
+            return entrada[1].copy(deep=False)
+        cache["falhas"] += 1
+    
+    df = carregar()
+    with cache["lock"]:
+        # Descarta snapshots de versões antigas do mesmo tipo (outros filtros)
+        for antiga in [c for c, e in cache["entradas"].items() if c[0] == chave[0] and e[0] != versao]:
+            del cache["entradas"][antiga]
+        cache["entradas"][chave] = (versao, df)
+    return df.copy(deep=False)
+
+def cache_invalidar(prefixo=None):
+    cache = _cache_dados()
+    with cache["lock"]:
+        if prefixo in (None, "cartoes"):
+            cache["cartoes"].clear()
+        if prefixo is None:
+            cache["entradas"].clear()
+        else:
+            for chave in [c for c in cache["entradas"] if c[0] == prefixo]:
+                del cache["entradas"][chave]
+
+def estatisticas_cache():
+    cache = _cache_dados()
+    with cache["lock"]:
+        total = cache["acertos"] + cache["falhas"]
+        return {
+            "acertos": cache["acertos"],
+            "falhas": cache["falhas"],
+            "taxa_acerto": cache["acertos"] / total if total else 0.0,
+            "entradas": len(cache["entradas"]) + len(cache["cartoes"])
+        }
+
+# ============================================
+# REGISTRO DE EVENTOS
+# ============================================
+# Status de destino -> tipo do evento registrado
+TIPOS_EVENTO_STATUS = {
+    "Pendente": "reabrir",
+    "Em andamento": "iniciar",
+    "Pausado": "pausar",
+    "Concluído": "finalizar"
+}
+
+def registrar_evento(conn, id_pedido, tipo, status=None, funcionario=None, momento=None):
+    """Acrescenta um evento ao registro; deve rodar dentro da transação da escrita."""
+    conn.execute(
+        "INSERT INTO eventos (id_pedido, tipo, status, funcionario, momento) VALUES (?, ?, ?, ?, ?)",
+        (int(id_pedido), tipo, status, funcionario, momento if momento is not None else time())
+    )
+
+def _aplicar_evento(estado, evento):
+    """Aplica um evento ao estado de um pedido (dict com as colunas de snapshot_pedidos)."""
+    if evento["tipo"] == "excluir":
+        estado["excluido"] = 1
+    if evento["funcionario"] is not None:
+        estado["funcionario"] = evento["funcionario"]
+    if evento["status"] is not None:
+        # Fecha o trecho de trabalho aberto ao sair de "Em andamento"
+        if estado["inicio_trecho"] is not None and evento["status"] != "Em andamento":
+            estado["segundos_trabalhados"] += evento["momento"] - estado["inicio_trecho"]
+            estado["inicio_trecho"] = None
+        elif evento["status"] == "Em andamento" and estado["inicio_trecho"] is None:
+            estado["inicio_trecho"] = evento["momento"]
+        estado["status"] = evento["status"]
+    return estado
+
+def _estado_vazio(id_pedido):
+    return {
+        "id_pedido": id_pedido,
+        "status": None,
+        "funcionario": None,
+        "segundos_trabalhados": 0.0,
+        "inicio_trecho": None,
+        "excluido": 0
     }
-    st.session_state.notificado = False
 
-def atualizar_status_pedido(id_pedido, novo_status):
-    df = carregar_pedidos()
-    idx = df[df["ID"] == id_pedido].index
+def reconstruir_estado(ids=None):
+    """Estado atual dos pedidos a partir do último snapshot + eventos posteriores.
+
+    Sem `ids`, reconstrói todos os pedidos; com `ids`, lê apenas esses pelo índice.
+    """
+    conn = conectar_banco()
+    conn.execute("BEGIN")  # leitura consistente entre snapshot e eventos
+    try:
+        seq_snapshot = int(conn.execute("SELECT valor FROM meta WHERE chave = 'seq_snapshot'").fetchone()[0])
+        if ids is None:
+            snapshots = conn.execute("SELECT * FROM snapshot_pedidos").fetchall()
+            eventos = conn.execute("SELECT * FROM eventos WHERE seq > ? ORDER BY seq", (seq_snapshot,)).fetchall()
+        else:
+            ids = [int(i) for i in ids]
+            marcadores = ", ".join("?" * len(ids))
+            snapshots = conn.execute(
+                f"SELECT * FROM snapshot_pedidos WHERE id_pedido IN ({marcadores})", ids
+            ).fetchall()
+            eventos = conn.execute(
+                f"SELECT * FROM eventos WHERE id_pedido IN ({marcadores}) AND seq > ? ORDER BY seq",
+                (*ids, seq_snapshot)
+            ).fetchall()
+    finally:
+        conn.execute("COMMIT")
     
-    if not idx.empty:
-        status_atual = df.loc[idx, "Status"].values[0]
-        df.loc[idx, "Status"] = novo_status
+    estados = {linha["id_pedido"]: dict(linha) for linha in snapshots}
+    for evento in eventos:
+        estado = estados.setdefault(evento["id_pedido"], _estado_vazio(evento["id_pedido"]))
+        _aplicar_evento(estado, evento)
+    return estados
+
+def tempos_trabalhados(ids):
+    """Segundos efetivamente em "Em andamento" por pedido, descontando as pausas."""
+    agora = time()
+    tempos = {}
+    for id_pedido, estado in reconstruir_estado(ids).items():
+        segundos = estado["segundos_trabalhados"]
+        if estado["inicio_trecho"] is not None:
+            segundos += agora - estado["inicio_trecho"]
+        tempos[id_pedido] = segundos
+    return tempos
+
+def compactar_eventos():
+    """Incorpora os eventos novos ao snapshot e apaga os que passaram da retenção."""
+    with transacao(alterar_versao=False) as conn:
+        seq_snapshot = int(conn.execute("SELECT valor FROM meta WHERE chave = 'seq_snapshot'").fetchone()[0])
+        eventos = conn.execute("SELECT * FROM eventos WHERE seq > ? ORDER BY seq", (seq_snapshot,)).fetchall()
+        if not eventos:
+            return 0
         
-        agora = datetime.now().strftime("%d/%m/%Y %H:%M")
+        ids = sorted({evento["id_pedido"] for evento in eventos})
+        estados = {}
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            for linha in conn.execute(
+                f"SELECT * FROM snapshot_pedidos WHERE id_pedido IN ({', '.join('?' * len(lote))})", lote
+            ):
+                estados[linha["id_pedido"]] = dict(linha)
+        for evento in eventos:
+            estado = estados.setdefault(evento["id_pedido"], _estado_vazio(evento["id_pedido"]))
+            _aplicar_evento(estado, evento)
         
-        if novo_status == "Em andamento" and status_atual != "Em andamento":
-            df.loc[idx, "Data Início"] = agora
-        elif novo_status == "Concluído":
-            df.loc[idx, "Data Conclusão"] = agora
+        conn.executemany(
+            "INSERT OR REPLACE INTO snapshot_pedidos "
+            "(id_pedido, status, funcionario, segundos_trabalhados, inicio_trecho, excluido) "
+            "VALUES (:id_pedido, :status, :funcionario, :segundos_trabalhados, :inicio_trecho, :excluido)",
+            list(estados.values())
+        )
+        ultimo_seq = eventos[-1]["seq"]
+        conn.execute("UPDATE meta SET valor = ? WHERE chave = 'seq_snapshot'", (str(ultimo_seq),))
+        conn.execute(
+            "DELETE FROM eventos WHERE seq <= ? AND momento < ?",
+            (ultimo_seq, time() - RETENCAO_EVENTOS_DIAS * 86400)
+        )
+        # Uma sessão que não atualiza sua fila há mais que o timeout já expirou,
+        # então saídas mais antigas que isso não são mais consultadas
+        podadas_ate = conn.execute(
+            "SELECT MAX(versao) FROM saidas_pedidos WHERE momento < ?",
+            (time() - 2 * TIMEOUT_MINUTOS * 60,)
+        ).fetchone()[0]
+        if podadas_ate is not None:
+            conn.execute("DELETE FROM saidas_pedidos WHERE versao <= ?", (podadas_ate,))
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('saidas_podadas_ate', ?)", (str(podadas_ate),)
+            )
+    return len(eventos)
+
+def _laco_manutencao():
+    while True:
+        sleep(INTERVALO_COMPACTACAO)
+        # Cada tarefa falha sozinha (banco ocupado, disco cheio, partição corrompida)
+        # e tenta de novo no próximo ciclo; a thread nunca pode morrer
+        for tarefa in (compactar_eventos, arquivar_concluidos, podar_notificacoes):
+            try:
+                tarefa()
+            except Exception:
+                log.exception("Falha na manutenção (%s); nova tentativa no próximo ciclo", tarefa.__name__)
+
+@st.cache_resource
+def iniciar_manutencao():
+    """Inicia (uma vez por processo) a thread de compactação em segundo plano."""
+    thread = threading.Thread(target=_laco_manutencao, name="manutencao-pedidos", daemon=True)
+    thread.start()
+    return thread
+
+# ============================================
+# NOTIFICAÇÕES
+# ============================================
+# Mensagens na tabela "notificacoes": quem publica e quem consulta podem estar
+# em processos diferentes. A sequência (AUTOINCREMENT) nunca é reaproveitada.
+def publicar_notificacao(funcionario, tipo, id_pedido, numero):
+    """Publica uma mensagem para o funcionário; chamar depois do commit da escrita."""
+    with transacao(alterar_versao=False) as conn:
+        _inserir_notificacoes(conn, [(funcionario, tipo, id_pedido, numero)])
+
+def _inserir_notificacoes(conn, mensagens):
+    """Grava (funcionário, tipo, id_pedido, número) na transação de quem chama."""
+    momento = time()
+    conn.executemany(
+        "INSERT INTO notificacoes (funcionario, tipo, id_pedido, numero, momento) VALUES (?, ?, ?, ?, ?)",
+        [(funcionario, tipo, int(id_pedido), int(numero), momento) for funcionario, tipo, id_pedido, numero in mensagens]
+    )
+
+def _avisos_de_saida(linhas):
+    """Uma mensagem por dono anterior das `linhas`: "removido" (com o número) ou "removidos" (com a quantidade)."""
+    por_dono = defaultdict(list)
+    for linha in linhas:
+        if linha["funcionario"]:
+            por_dono[linha["funcionario"]].append(linha)
+    return [
+        (dono, "removido", saidas[0]["id"], saidas[0]["pedido"]) if len(saidas) == 1
+        else (dono, "removidos", saidas[0]["id"], len(saidas))
+        for dono, saidas in por_dono.items()
+    ]
+
+def seq_notificacoes():
+    linha = conectar_banco().execute("SELECT seq FROM sqlite_sequence WHERE name = 'notificacoes'").fetchone()
+    return linha[0] if linha else 0
+
+def notificacoes_desde(funcionario, seq):
+    """Mensagens do funcionário com sequência maior que `seq`, em ordem."""
+    return [dict(linha) for linha in conectar_banco().execute(
+        "SELECT seq, tipo, id_pedido, numero, momento FROM notificacoes "
+        "WHERE funcionario = ? AND seq > ? ORDER BY seq LIMIT ?",
+        (funcionario, int(seq), MAX_NOTIFICACOES_POR_FUNCIONARIO)
+    )]
+
+def podar_notificacoes():
+    with transacao(alterar_versao=False) as conn:
+        return conn.execute(
+            "DELETE FROM notificacoes WHERE momento < ?", (time() - RETENCAO_NOTIFICACOES_MINUTOS * 60,)
+        ).rowcount
+
+# ============================================
+# FUNÇÕES DE PEDIDOS
+# ============================================
+class ConflitoEdicao(Exception):
+    """O pedido foi alterado (ou excluído) por outra sessão depois de lido."""
+
+    def __init__(self, id_pedido, atual):
+        super().__init__(f"Pedido {id_pedido} foi alterado por outra pessoa")
+        self.id_pedido = id_pedido
+        self.atual = atual
+
+@medir
+def carregar_pedidos(funcionario=None, status=None):
+    return cache_obter(
+        ("pedidos", funcionario, status),
+        versao_pedidos(),
+        lambda: _ler_pedidos(funcionario, status)
+    )
+
+def faixas_prefixo(prefixo):
+    """Intervalos [início, fim] dos números de pedido que começam com `prefixo`.
+
+    Um intervalo por quantidade de dígitos (no máximo 19 para um int64), então
+    a busca por prefixo vira poucas leituras por faixa no índice do número.
+    """
+    if prefixo.startswith("0"):
+        return [(0, 0)] if prefixo == "0" else []
+    base = int(prefixo)
+    faixas = []
+    for extra in range(len(str(MAX_PEDIDO)) - len(prefixo) + 1):
+        inicio = base * 10 ** extra
+        if inicio > MAX_PEDIDO:
+            break
+        faixas.append((inicio, min((base + 1) * 10 ** extra - 1, MAX_PEDIDO)))
+    return faixas
+
+def montar_busca(prefixo="", datas=None):
+    """Critérios extras de busca num formato imutável (serve de chave de cache).
+
+    `prefixo` é o começo do número do pedido e `datas` mapeia colunas de
+    DATAS_BUSCA para intervalos (início, fim) em epoch. Retorna None sem critérios.
+    """
+    prefixo = (prefixo or "").strip()
+    if prefixo and not prefixo.isdigit():
+        raise ValueError("O número do pedido deve conter apenas dígitos")
+    intervalos = tuple(sorted((campo, float(inicio), float(fim)) for campo, (inicio, fim) in (datas or {}).items()))
+    if not prefixo and not intervalos:
+        return None
+    return prefixo, intervalos
+
+def _filtros_busca(busca):
+    filtros, params = [], []
+    if busca is None:
+        return filtros, params
+    prefixo, intervalos = busca
+    if prefixo:
+        faixas = faixas_prefixo(prefixo)
+        filtros.append("(" + " OR ".join(["pedido BETWEEN ? AND ?"] * len(faixas)) + ")" if faixas else "0")
+        params += [valor for faixa in faixas for valor in faixa]
+    for campo, inicio, fim in intervalos:
+        filtros.append(f"{campo} BETWEEN ? AND ?")
+        params += [inicio, fim]
+    return filtros, params
+
+def _filtros_sql(funcionario=None, status=None, busca=None):
+    filtros, params = _filtros_busca(busca)
+    # Com faixas de busca, o "+" tira funcionário e status da escolha de índice: sem
+    # ele o SQLite prefere a igualdade (poucos valores distintos) a uma faixa estreita
+    prefixo = "+" if filtros else ""
+    if funcionario is not None:
+        filtros.append(prefixo + "funcionario = ?")
+        params.append(funcionario)
+    if status is not None:
+        filtros.append(prefixo + "status = ?")
+        params.append(status)
+    return (" WHERE " + " AND ".join(filtros) if filtros else ""), params
+
+def _ler_pedidos(funcionario=None, status=None, ordem="id", limite=None, deslocamento=0, busca=None):
+    where, params = _filtros_sql(funcionario, status, busca)
+    if busca is not None:
+        # Uma busca costuma casar poucas linhas: ler a faixa no índice e ordenar o
+        # resultado sai mais barato que varrer a tabela na ordem pedida até o LIMIT
+        ordem = ", ".join("+" + termo.strip() for termo in ordem.split(","))
+    sql = where + " ORDER BY " + ordem
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limite), int(deslocamento)]
+    return _consultar_pedidos(conectar_banco(), sql, params)
+
+def _consultar_pedidos(conn, complemento, params):
+    """DataFrame com as colunas de exibição para "SELECT ... FROM pedidos" + complemento."""
+    sql = "SELECT " + ", ".join(CAMPOS_PEDIDOS.values()) + ", versao_alteracao FROM pedidos" + complemento
+    df = pd.read_sql_query(sql, conn, params=params, coerce_float=True)
+    df.columns = COLUNAS_PEDIDOS + [COLUNA_VERSAO]
+    for coluna in COLUNAS_DATA:
+        df[coluna] = df[coluna].astype("float64")  # colunas todas nulas vêm como object
+    return aplicar_esquema_pedidos(df)
+
+@medir
+def pedidos_abertos_funcionario(funcionario, desde_versao=None):
+    """Fila em aberto do funcionário, lida pelos índices por funcionário.
+
+    Sem `desde_versao` devolve a fila inteira; com ela, só as linhas do funcionário
+    alteradas depois dessa versão (podem vir concluídas, para saírem da fila) e os
+    IDs que deixaram de ser dele (excluídos ou redesignados).
+    Retorna (versao_atual, alterados_df, ids_removidos, completo); com `completo`
+    verdadeiro o resultado é a fila inteira e substitui a que o cliente tinha.
+    """
+    conn = conectar_banco()
+    conn.execute("BEGIN")  # versão e linhas lidas do mesmo snapshot
+    try:
+        versao = conn.execute("SELECT valor FROM versao WHERE id = 1").fetchone()[0]
+        if desde_versao is not None:
+            podadas = conn.execute("SELECT valor FROM meta WHERE chave = 'saidas_podadas_ate'").fetchone()
+            if podadas is not None and int(desde_versao) < int(podadas[0]):
+                desde_versao = None
+        if desde_versao is None:
+            alterados = _consultar_pedidos(
+                conn, " WHERE funcionario = ? AND status != 'Concluído' ORDER BY prioridade DESC, data_prazo, id", [funcionario]
+            )
+            removidos = []
+        else:
+            alterados = _consultar_pedidos(
+                conn, " WHERE funcionario = ? AND versao_alteracao > ? ORDER BY id", [funcionario, int(desde_versao)]
+            )
+            removidos = [linha[0] for linha in conn.execute(
+                "SELECT id_pedido FROM saidas_pedidos WHERE funcionario = ? AND versao > ?",
+                (funcionario, int(desde_versao))
+            )]
+    finally:
+        conn.execute("COMMIT")
+    return versao, alterados, removidos, desde_versao is None
+
+def _registrar_saidas(conn, ids):
+    # Marca os pedidos como "saíram da fila" do funcionário atual antes de alterá-los
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        conn.execute(
+            "INSERT INTO saidas_pedidos (funcionario, id_pedido, versao, momento) "
+            f"SELECT funcionario, id, {VERSAO_ATUAL_SQL}, ? FROM pedidos "
+            f"WHERE funcionario IS NOT NULL AND id IN ({', '.join('?' * len(lote))})",
+            (time(), *lote)
+        )
+
+@medir
+def contar_pedidos(funcionario=None, status=None, periodo=None, busca=None):
+    if status == "Concluído":
+        return len(pedidos_concluidos(funcionario, periodo, busca))
+    where, params = _filtros_sql(funcionario, status, busca)
+    return conectar_banco().execute("SELECT COUNT(*) FROM pedidos" + where, params).fetchone()[0]
+
+@medir
+def listar_pedidos(funcionario=None, status=None, ordenacao="Mais recentes", limite=TAMANHO_PAGINA_PADRAO, deslocamento=0, periodo=None, busca=None):
+    """Uma página de pedidos, filtrada e ordenada no banco (usa os índices).
+
+    Os concluídos vêm de `pedidos_concluidos` (banco + arquivo no `periodo`).
+    `busca` (de `montar_busca`) soma prefixo do número e intervalos de datas.
+    """
+    ordem = ORDENACOES_PEDIDOS[ordenacao]
+    if status == "Concluído":
+        df = _ordenar_pedidos(pedidos_concluidos(funcionario, periodo, busca), ordem)
+        return df.iloc[int(deslocamento):int(deslocamento) + int(limite)]
+    return cache_obter(
+        ("pedidos", "pagina", funcionario, status, ordem, limite, deslocamento, busca),
+        versao_pedidos(),
+        lambda: _ler_pedidos(funcionario, status, ordem, limite, deslocamento, busca)
+    )
+
+def funcionarios_com_pedidos():
+    # Lido dos agregados (uma linha por funcionário/status), inclui quem só tem arquivados
+    return [linha[0] for linha in conectar_banco().execute(
+        "SELECT DISTINCT funcionario FROM metricas_contagem WHERE funcionario != '' AND quantidade > 0 ORDER BY funcionario"
+    )]
+
+@medir
+def salvar_pedidos(df):
+    """Grava (insere ou substitui) as linhas do DataFrame numa única transação."""
+    if df.empty:
+        return 0
+    df = aplicar_esquema_pedidos(df[COLUNAS_PEDIDOS])
+    linhas = [_linha_para_valores(linha) for linha in df.to_dict("records")]
+    sql = "INSERT OR REPLACE INTO pedidos ({}, versao_alteracao) VALUES ({}, {})".format(
+        ", ".join(CAMPOS_PEDIDOS.values()),
+        ", ".join("?" * len(CAMPOS_PEDIDOS)),
+        VERSAO_ATUAL_SQL
+    )
+    indice = COLUNAS_PEDIDOS.index
+    momento = time()
+    # Abertos sem prazo (CSV antigo, planilhas) ganham o SLA padrão da prioridade
+    for l in linhas:
+        if l[indice("Prazo")] is None and l[indice("Status")] != "Concluído":
+            l[indice("Prazo")] = prazo_padrao(l[indice("Prioridade")], l[indice("Data Criação")] or momento)
+    with transacao() as conn:
+        ids = [l[indice("ID")] for l in linhas]
+        # Linhas que substituem um pedido existente entram no histórico como edição
+        substituidos = set()
+        for lote in _em_lotes(ids):
+            substituidos.update(linha[0] for linha in conn.execute(
+                f"SELECT id FROM pedidos WHERE id IN ({', '.join('?' * len(lote))})", lote
+            ))
+        _registrar_saidas(conn, ids)
+        _metricas_substituir(conn, linhas)
+        conn.executemany(sql, linhas)
+        conn.executemany(
+            "INSERT INTO eventos (id_pedido, tipo, status, funcionario, momento) VALUES (?, ?, ?, ?, ?)",
+            [
+                (l[indice("ID")], "editar" if l[indice("ID")] in substituidos else "criar",
+                 l[indice("Status")], l[indice("Funcionário")], momento)
+                for l in linhas
+            ]
+        )
+    motor_invalidar()
+    return len(linhas)
+
+def ler_pedido(id_pedido):
+    """Linha de exibição (tipada) de um único pedido; vazia se ele não existe mais."""
+    return _consultar_pedidos(conectar_banco(), " WHERE id = ?", [int(id_pedido)])
+
+def excluir_pedido(id_pedido, versao_esperada=None):
+    with transacao() as conn:
+        linha = _ler_para_edicao(conn, id_pedido, versao_esperada)
+        if linha is None:
+            return False
+        _registrar_saidas(conn, [int(id_pedido)])
+        conn.execute(
+            "DELETE FROM pedidos WHERE id = ? AND versao_alteracao = ?",
+            (int(id_pedido), linha["versao_alteracao"])
+        )
+        _contar(conn, linha["funcionario"], linha["status"], -1)
+        registrar_evento(conn, id_pedido, "excluir")
+    
+    motor_registrar_alteracoes([(linha["funcionario"], linha["status"], None, None, None)])
+    if linha["funcionario"]:
+        publicar_notificacao(linha["funcionario"], "removido", id_pedido, linha["pedido"])
+    return True
+
+def prazo_padrao(prioridade, criacao):
+    return criacao + PRAZO_PADRAO_HORAS[prioridade] * 3600
+
+def adicionar_pedido(num_pedido, funcionario, prioridade=PRIORIDADE_PADRAO, prazo=None):
+    """Cria o pedido; sem `prazo` (epoch), vale o SLA padrão da prioridade."""
+    agora = time()
+    with transacao() as conn:
+        cursor = conn.execute(
+            "INSERT INTO pedidos (pedido, funcionario, status, data_criacao, data_designacao, prioridade, data_prazo, versao_alteracao) "
+            f"VALUES (?, ?, 'Pendente', ?, ?, ?, ?, {VERSAO_ATUAL_SQL})",
+            (int(num_pedido), funcionario, agora, agora, int(prioridade), prazo or prazo_padrao(prioridade, agora))
+        )
+        _contar(conn, funcionario, "Pendente", 1)
+        registrar_evento(conn, cursor.lastrowid, "criar", "Pendente", funcionario)
+    
+    motor_registrar_alteracoes([(None, None, funcionario, "Pendente", None)])
+    publicar_notificacao(funcionario, "novo", cursor.lastrowid, num_pedido)
+    return cursor.lastrowid
+
+def _ler_para_edicao(conn, id_pedido, versao_esperada):
+    """Linha atual do pedido; com `versao_esperada`, exige que ninguém a tenha alterado."""
+    linha = conn.execute(
+        "SELECT pedido, funcionario, status, data_inicio, prioridade, versao_alteracao FROM pedidos WHERE id = ?", (int(id_pedido),)
+    ).fetchone()
+    if versao_esperada is not None and (linha is None or linha["versao_alteracao"] != int(versao_esperada)):
+        raise ConflitoEdicao(id_pedido, dict(linha) if linha else None)
+    return linha
+
+def _campos_edicao(linha, funcionario, status, agora, prioridade=None):
+    campos = {}
+    if prioridade is not None and int(prioridade) != linha["prioridade"]:
+        campos["prioridade"] = int(prioridade)
+    if funcionario is not None and funcionario != linha["funcionario"]:
+        campos["funcionario"] = funcionario
+        campos["data_designacao"] = agora
+    if status is not None:
+        campos["status"] = status
+        if status == "Em andamento" and linha["status"] != "Em andamento":
+            campos["data_inicio"] = agora
+        elif status == "Concluído":
+            campos["data_conclusao"] = agora
+    return campos
+
+def _gravar_edicao(conn, id_pedido, linha, campos):
+    if "funcionario" in campos:
+        _registrar_saidas(conn, [int(id_pedido)])
+    conn.execute(
+        "UPDATE pedidos SET " + ", ".join(f"{c} = ?" for c in campos)
+        + f", versao_alteracao = {VERSAO_ATUAL_SQL} WHERE id = ? AND versao_alteracao = ?",
+        (*campos.values(), int(id_pedido), linha["versao_alteracao"])
+    )
+    if "funcionario" in campos:
+        registrar_evento(conn, id_pedido, "designar", funcionario=campos["funcionario"])
+    if "status" in campos:
+        registrar_evento(conn, id_pedido, TIPOS_EVENTO_STATUS.get(campos["status"], "status"), campos["status"])
+    if "prioridade" in campos:
+        registrar_evento(conn, id_pedido, "priorizar")
+    
+    funcionario = campos.get("funcionario", linha["funcionario"])
+    status = campos.get("status", linha["status"])
+    if (funcionario, status) != (linha["funcionario"], linha["status"]):
+        _contar(conn, linha["funcionario"], linha["status"], -1)
+        _contar(conn, funcionario, status, 1)
+    if "data_conclusao" in campos and linha["status"] != "Concluído":
+        _registrar_conclusao(conn, funcionario, linha["data_inicio"], campos["data_conclusao"])
+
+def _alteracao_motor(linha, campos, agora):
+    """(funcionário e status antes, funcionário e status depois, duração) de uma edição."""
+    duracao = None
+    if campos.get("status") == "Concluído" and linha["status"] != "Concluído" and linha["data_inicio"]:
+        duracao = agora - linha["data_inicio"]
+    return (
+        linha["funcionario"], linha["status"],
+        campos.get("funcionario", linha["funcionario"]), campos.get("status", linha["status"]),
+        duracao
+    )
+
+def _apos_edicao(id_pedido, linha, campos, agora):
+    """Atualiza o motor de designação e avisa os funcionários (depois do commit)."""
+    motor_registrar_alteracoes([_alteracao_motor(linha, campos, agora)])
+    if "funcionario" in campos:
+        publicar_notificacao(campos["funcionario"], "novo", id_pedido, linha["pedido"])
+        if linha["funcionario"]:
+            publicar_notificacao(linha["funcionario"], "removido", id_pedido, linha["pedido"])
+
+@medir
+def editar_pedido(id_pedido, funcionario=None, status=None, versao_esperada=None, prioridade=None):
+    """Altera a designação, o status e/ou a prioridade do pedido numa única transação.
+
+    Com `versao_esperada` (a coluna "Versão" lida pela tela) a escrita é um
+    compare-and-swap: se a linha mudou desde a leitura, levanta ConflitoEdicao
+    em vez de sobrescrever a alteração de outra pessoa.
+    """
+    agora = time()
+    with transacao() as conn:
+        linha = _ler_para_edicao(conn, id_pedido, versao_esperada)
+        if linha is None:
+            return False
+        campos = _campos_edicao(linha, funcionario, status, agora, prioridade)
+        if not campos:
+            return True
+        _gravar_edicao(conn, id_pedido, linha, campos)
+    
+    _apos_edicao(id_pedido, linha, campos, agora)
+    return True
+
+@medir
+def atualizar_status_pedido(id_pedido, novo_status, versao_esperada=None):
+    return editar_pedido(id_pedido, status=novo_status, versao_esperada=versao_esperada)
+
+# ============================================
+# OPERAÇÕES EM LOTE
+# ============================================
+def _em_lotes(valores, tamanho=500):
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+def interpretar_numeros_pedido(valores):
+    """Separa números de pedido válidos (sem repetição, na ordem) de entradas inválidas.
+
+    Retorna (validos, invalidos, repetidos), em que `repetidos` conta as
+    repetições dentro da própria entrada.
+    """
+    validos, vistos, invalidos, repetidos = [], set(), [], 0
+    for valor in valores:
+        texto = str(valor).strip()
+        if texto.endswith(".0"):  # números lidos de planilhas
+            texto = texto[:-2]
+        if not texto:
+            continue
+        if not texto.isdigit() or int(texto) > MAX_PEDIDO:
+            invalidos.append(texto)
+            continue
+        numero = int(texto)
+        if numero in vistos:
+            repetidos += 1
+            continue
+        vistos.add(numero)
+        validos.append(numero)
+    return validos, invalidos, repetidos
+
+def ler_numeros_texto(texto):
+    return re.split(r"[\s,;]+", texto or "")
+
+def ler_numeros_arquivo(arquivo):
+    """Valores da coluna "Pedido" (ou da primeira coluna) de um CSV/XLSX enviado."""
+    if arquivo.name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(arquivo, dtype=str, header=None)
+    else:
+        df = pd.read_csv(arquivo, dtype=str, header=None, sep=None, engine="python")
+    if df.empty:
+        return []
+    cabecalho = [str(valor).strip() for valor in df.iloc[0]]
+    if "Pedido" in cabecalho:
+        return df.iloc[1:, cabecalho.index("Pedido")].dropna().tolist()
+    return df.iloc[:, 0].dropna().tolist()
+
+def _pedidos_existentes(conn, numeros):
+    existentes = set()
+    for lote in _em_lotes(numeros):
+        existentes.update(linha[0] for linha in conn.execute(
+            f"SELECT pedido FROM pedidos WHERE pedido IN ({', '.join('?' * len(lote))})", lote
+        ))
+    return existentes
+
+def importar_pedidos(numeros, funcionario=None, prioridade=PRIORIDADE_PADRAO):
+    """Cria um pedido para cada número ainda inexistente, numa única escrita.
+
+    Sem `funcionario`, as designações vêm do motor de designação automática.
+    Todos recebem a `prioridade` e o prazo padrão dela.
+    Retorna (quantidade_criada, numeros_ja_existentes).
+    """
+    agora = time()
+    # Leitura prévia fora da transação: se todos já existem, a versão não muda
+    existentes = _pedidos_existentes(conectar_banco(), numeros)
+    if len(existentes) == len(set(numeros)):
+        return 0, sorted(existentes)
+    with transacao(alterar_versao=False) as conn:
+        existentes = _pedidos_existentes(conn, numeros)
+        novos = [numero for numero in numeros if numero not in existentes]
+        if not novos:
+            return 0, sorted(existentes)
+        _alterar_versao(conn)
         
-        salvar_pedidos(df)
-        return True
-    return False
+        destinos = [funcionario] * len(novos) if funcionario else escolher_funcionarios(len(novos))
+        if len(destinos) < len(novos):
+            raise ValueError("Nenhum funcionário cadastrado para receber os pedidos")
+        
+        # IDs alocados em bloco a partir da sequência (AUTOINCREMENT); inserir IDs
+        # explícitos a avança, e a trava de escrita impede outra reserva no meio
+        primeiro_id = conn.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'pedidos'), 0) + 1"
+        ).fetchone()[0]
+        prazo = prazo_padrao(prioridade, agora)
+        linhas = [
+            (primeiro_id + i, numero, destino, agora, agora, int(prioridade), prazo)
+            for i, (numero, destino) in enumerate(zip(novos, destinos))
+        ]
+        conn.executemany(
+            "INSERT INTO pedidos (id, pedido, funcionario, status, data_criacao, data_designacao, prioridade, data_prazo, versao_alteracao) "
+            f"VALUES (?, ?, ?, 'Pendente', ?, ?, ?, ?, {VERSAO_ATUAL_SQL})",
+            linhas
+        )
+        conn.executemany(
+            "INSERT INTO eventos (id_pedido, tipo, status, funcionario, momento) VALUES (?, 'criar', 'Pendente', ?, ?)",
+            [(linha[0], linha[2], agora) for linha in linhas]
+        )
+        por_funcionario = defaultdict(int)
+        for destino in destinos:
+            por_funcionario[destino] += 1
+        for destino, quantidade in por_funcionario.items():
+            _contar(conn, destino, "Pendente", quantidade)
+    
+    motor_invalidar()
+    for destino, quantidade in por_funcionario.items():
+        publicar_notificacao(destino, "lote", primeiro_id, quantidade)
+    return len(novos), sorted(existentes)
+
+def _ler_para_edicao_em_lote(conn, versoes):
+    linhas = {}
+    for lote in _em_lotes(list(versoes)):
+        for linha in conn.execute(
+            "SELECT id, pedido, funcionario, status, data_inicio, prioridade, versao_alteracao FROM pedidos "
+            f"WHERE id IN ({', '.join('?' * len(lote))})",
+            [int(i) for i in lote]
+        ):
+            linhas[linha["id"]] = linha
+    return linhas
+
+def editar_pedidos_em_lote(versoes, funcionario=None, status=None):
+    """Redesigna e/ou muda o status de vários pedidos numa única transação.
+
+    `versoes` mapeia ID -> versão lida pela tela; pedidos alterados ou excluídos
+    desde então são deixados como estão. Retorna (alterados, conflitos).
+    """
+    agora = time()
+    aplicados, conflitos = [], 0
+    with transacao() as conn:
+        linhas = _ler_para_edicao_em_lote(conn, versoes)
+        for id_pedido, versao in versoes.items():
+            linha = linhas.get(int(id_pedido))
+            if linha is None or linha["versao_alteracao"] != int(versao):
+                conflitos += 1
+                continue
+            campos = _campos_edicao(linha, funcionario, status, agora)
+            if campos:
+                _gravar_edicao(conn, id_pedido, linha, campos)
+                aplicados.append((id_pedido, linha, campos))
+        # Quem perdeu pedidos também é avisado, para a tela dele tirá-los da fila
+        mensagens = _avisos_de_saida([linha for _, linha, campos in aplicados if "funcionario" in campos])
+        if funcionario is not None and aplicados:
+            mensagens.append((funcionario, "lote", aplicados[0][0], len(aplicados)))
+        _inserir_notificacoes(conn, mensagens)
+    
+    motor_registrar_alteracoes([_alteracao_motor(linha, campos, agora) for _, linha, campos in aplicados])
+    return len(aplicados), conflitos
+
+def excluir_pedidos_em_lote(versoes):
+    """Exclui vários pedidos numa única transação; retorna (excluidos, conflitos)."""
+    excluidos, conflitos = [], 0
+    with transacao() as conn:
+        linhas = _ler_para_edicao_em_lote(conn, versoes)
+        for id_pedido, versao in versoes.items():
+            linha = linhas.get(int(id_pedido))
+            if linha is None or linha["versao_alteracao"] != int(versao):
+                conflitos += 1
+                continue
+            excluidos.append(linha)
+        ids = [linha["id"] for linha in excluidos]
+        _registrar_saidas(conn, ids)
+        conn.executemany("DELETE FROM pedidos WHERE id = ?", [(i,) for i in ids])
+        for linha in excluidos:
+            _contar(conn, linha["funcionario"], linha["status"], -1)
+        conn.executemany(
+            "INSERT INTO eventos (id_pedido, tipo, momento) VALUES (?, 'excluir', ?)",
+            [(i, time()) for i in ids]
+        )
+        _inserir_notificacoes(conn, _avisos_de_saida(excluidos))
+    
+    motor_registrar_alteracoes([(linha["funcionario"], linha["status"], None, None, None) for linha in excluidos])
+    return len(excluidos), conflitos
+
+# ============================================
+# PRAZOS E ESCALONAMENTO
+# ============================================
+# A fila de cada funcionário é ordenada por (prioridade, prazo). Uma varredura
+# periódica lê só os abertos com prazo próximo (índice parcial por prazo) e os
+# sobe para PRIORIDADE_ESCALADA, em vez de recalcular a urgência a cada tela.
+SQL_PRAZOS_PROXIMOS = (
+    "SELECT id, pedido, funcionario, prioridade FROM pedidos "
+    "WHERE status != 'Concluído' AND data_prazo <= ? AND escalado IS NULL"
+)
+
+def chave_urgencia(linha):
+    """Ordenação da fila: maior prioridade, depois prazo mais próximo (sem prazo por último)."""
+    sem_prazo = pd.isna(linha["Prazo"])
+    return (-int(linha["Prioridade"]), sem_prazo, 0 if sem_prazo else linha["Prazo"], linha["ID"])
+
+def escalar_pedidos(agora=None):
+    """Escala os abertos a menos de ANTECEDENCIA_ESCALONAMENTO_MINUTOS do prazo; retorna quantos."""
+    limite = (agora or time()) + ANTECEDENCIA_ESCALONAMENTO_MINUTOS * 60
+    # Leitura prévia fora da transação: sem candidatos, a versão (e os caches) não mudam
+    if conectar_banco().execute(SQL_PRAZOS_PROXIMOS + " LIMIT 1", (limite,)).fetchone() is None:
+        return 0
+    momento = time()
+    with transacao(alterar_versao=False) as conn:
+        linhas = conn.execute(SQL_PRAZOS_PROXIMOS, (limite,)).fetchall()
+        if not linhas:
+            return 0  # outro processo escalou entre a leitura prévia e a trava
+        _alterar_versao(conn)
+        conn.executemany(
+            f"UPDATE pedidos SET prioridade = MAX(prioridade, ?), escalado = ?, versao_alteracao = {VERSAO_ATUAL_SQL} "
+            "WHERE id = ?",
+            [(PRIORIDADE_ESCALADA, momento, linha["id"]) for linha in linhas]
+        )
+        for linha in linhas:
+            registrar_evento(conn, linha["id"], "escalar", momento=momento)
+
+    for linha in linhas:
+        if linha["funcionario"]:
+            publicar_notificacao(linha["funcionario"], "escalado", linha["id"], linha["pedido"])
+    return len(linhas)
+
+def _laco_escalonamento():
+    while True:
+        sleep(INTERVALO_ESCALONAMENTO)
+        try:
+            escalar_pedidos()
+        except Exception:
+            log.exception("Falha ao escalar prazos; nova tentativa na próxima varredura")
+
+@st.cache_resource
+def iniciar_escalonamento():
+    thread = threading.Thread(target=_laco_escalonamento, name="escalonamento-prazos", daemon=True)
+    thread.start()
+    return thread
+
+def pedidos_em_risco(limite=MAX_PEDIDOS_EM_RISCO):
+    """Abertos com o prazo mais próximo (vencidos primeiro), lidos pelo índice de prazos."""
+    return _consultar_pedidos(
+        conectar_banco(),
+        " WHERE status != 'Concluído' AND data_prazo IS NOT NULL ORDER BY data_prazo LIMIT ?",
+        [int(limite)]
+    )
+
+# ============================================
+# ARQUIVO DE CONCLUÍDOS
+# ============================================
+# Concluídos há mais de ATRASO_ARQUIVAMENTO_HORAS saem do banco para um
+# Parquet por mês de conclusão; o banco fica só com o trabalho em aberto.
+COLUNAS_ARQUIVO = ["id", *list(CAMPOS_PEDIDOS.values())[1:], "versao_alteracao"]
+PADRAO_PARTICAO = re.compile(r"^(\d{4})-(\d{2})\.parquet$")
+
+def _caminho_particao(mes):
+    return os.path.join(PASTA_ARQUIVO, f"{mes}.parquet")
+
+def _limites_mes(ano, mes):
+    inicio = datetime(ano, mes, 1)
+    fim = datetime(ano + mes // 12, mes % 12 + 1, 1)
+    return inicio.timestamp(), fim.timestamp()
+
+def particoes_arquivo(periodo=None):
+    """Arquivos mensais cujo mês cruza o período (inicio, fim) em epoch, em ordem."""
+    if not os.path.isdir(PASTA_ARQUIVO):
+        return []
+    particoes = []
+    for nome in sorted(os.listdir(PASTA_ARQUIVO)):
+        encontrado = PADRAO_PARTICAO.match(nome)
+        if not encontrado:
+            continue
+        inicio, fim = _limites_mes(int(encontrado.group(1)), int(encontrado.group(2)))
+        if periodo is None or (inicio <= periodo[1] and fim > periodo[0]):
+            particoes.append(os.path.join(PASTA_ARQUIVO, nome))
+    return particoes
+
+SQL_ARQUIVAVEIS = "FROM pedidos WHERE status = 'Concluído' AND COALESCE(data_conclusao, data_criacao, 0) < ?"
+
+def arquivar_concluidos(limite=None):
+    """Move para o arquivo os concluídos antes de `limite` (epoch); retorna quantos."""
+    if limite is None:
+        limite = time() - ATRASO_ARQUIVAMENTO_HORAS * 3600
+    # Leitura prévia fora da transação: sem candidatos, a versão (e os caches) não mudam
+    if conectar_banco().execute("SELECT 1 " + SQL_ARQUIVAVEIS + " LIMIT 1", (limite,)).fetchone() is None:
+        return 0
+    # A trava de escrita fica com esta transação até o fim, então nenhuma linha
+    # lida aqui muda antes de ser apagada
+    with transacao(alterar_versao=False) as conn:
+        linhas = conn.execute(
+            f"SELECT {', '.join(COLUNAS_ARQUIVO)} " + SQL_ARQUIVAVEIS, (limite,)
+        ).fetchall()
+        if not linhas:
+            return 0
+        _alterar_versao(conn)
+        
+        df = pd.DataFrame([tuple(linha) for linha in linhas], columns=COLUNAS_ARQUIVO)
+        momento = df["data_conclusao"].fillna(df["data_criacao"]).fillna(0)
+        meses = pd.Series(_coluna_data(momento), index=df.index).dt.strftime("%Y-%m")
+        os.makedirs(PASTA_ARQUIVO, exist_ok=True)
+        for mes, parte in df.groupby(meses):
+            caminho = _caminho_particao(mes)
+            if os.path.exists(caminho):
+                # Uma tentativa anterior interrompida pode ter deixado as mesmas linhas
+                parte = pd.concat([pd.read_parquet(caminho), parte], ignore_index=True)
+                parte = parte.drop_duplicates("id", keep="last")
+            parcial = caminho + ".parcial"
+            parte.sort_values("id").to_parquet(parcial, index=False)
+            os.replace(parcial, caminho)
+        
+        for lote in _em_lotes(df["id"].tolist()):
+            conn.execute(f"DELETE FROM pedidos WHERE id IN ({', '.join('?' * len(lote))})", lote)
+    return len(df)
+
+def _arquivo_para_exibicao(df):
+    """Linhas do arquivo no formato (e com os tipos) de `_consultar_pedidos`."""
+    df = df.rename(columns={"id": "ID", "versao_alteracao": COLUNA_VERSAO})
+    df = df.rename(columns={campo: coluna for coluna, campo in CAMPOS_PEDIDOS.items()})
+    # Partições gravadas antes da prioridade e do prazo não têm essas colunas
+    df = df.reindex(columns=COLUNAS_PEDIDOS + [COLUNA_VERSAO])
+    for coluna in COLUNAS_DATA:
+        df[coluna] = df[coluna].astype("float64")
+    return aplicar_esquema_pedidos(df[COLUNAS_PEDIDOS + [COLUNA_VERSAO]])
+
+def _filtros_arquivo(funcionario=None, periodo=None, busca=None):
+    filtros = []
+    if funcionario is not None:
+        filtros.append(("funcionario", "==", funcionario))
+    if periodo is not None:
+        filtros += [("data_conclusao", ">=", periodo[0]), ("data_conclusao", "<=", periodo[1])]
+    if busca is None:
+        return filtros or None
+    prefixo, intervalos = busca
+    for campo, inicio, fim in intervalos:
+        filtros += [(campo, ">=", inicio), (campo, "<=", fim)]
+    if not prefixo:
+        return filtros
+    # Prefixo: uma conjunção por faixa de números (forma normal disjuntiva do pyarrow)
+    return [filtros + [("pedido", ">=", inicio), ("pedido", "<=", fim)] for inicio, fim in faixas_prefixo(prefixo)]
+
+def _particoes_busca(periodo=None, busca=None):
+    """Partições que podem ter linhas da busca.
+
+    A conclusão nunca é anterior à criação nem ao início, então os inícios dos
+    intervalos de datas também limitam por baixo os meses de conclusão lidos.
+    """
+    inicios = [intervalo[1] for intervalo in busca[1]] if busca is not None else []
+    if busca is not None and busca[0] and not faixas_prefixo(busca[0]):
+        return []
+    if periodo is None and not inicios:
+        return particoes_arquivo()
+    fim = periodo[1] if periodo is not None else float("inf")
+    return particoes_arquivo((max(inicios + ([periodo[0]] if periodo is not None else [])), fim))
+
+def ler_arquivo(funcionario=None, periodo=None, busca=None):
+    """Concluídos arquivados, lendo só as partições do período (e só as linhas filtradas)."""
+    partes = [
+        pd.read_parquet(caminho, filters=_filtros_arquivo(funcionario, periodo, busca))
+        for caminho in _particoes_busca(periodo, busca)
+    ]
+    if not partes:
+        return aplicar_esquema_pedidos(pd.DataFrame(columns=COLUNAS_PEDIDOS + [COLUNA_VERSAO]))
+    return _arquivo_para_exibicao(pd.concat(partes, ignore_index=True))
+
+def ids_arquivados(ids):
+    """Dos `ids` (uma página), os que só existem no arquivo: são somente leitura."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return set()
+    no_banco = conectar_banco().execute(
+        f"SELECT id FROM pedidos WHERE id IN ({', '.join('?' * len(ids))})", ids
+    ).fetchall()
+    return set(ids) - {linha[0] for linha in no_banco}
+
+def _ler_concluidos(funcionario=None, periodo=None, busca=None):
+    filtros, params = _filtros_busca(busca)
+    filtros.append(("+" if filtros else "") + "status = 'Concluído'")
+    if funcionario is not None:
+        filtros.append("funcionario = ?")
+        params.append(funcionario)
+    if periodo is not None:
+        filtros.append("data_conclusao BETWEEN ? AND ?")
+        params += [periodo[0], periodo[1]]
+    recentes = _consultar_pedidos(conectar_banco(), " WHERE " + " AND ".join(filtros), params)
+    arquivados = ler_arquivo(funcionario, periodo, busca)
+    if arquivados.empty:
+        return recentes
+    # Se uma linha estiver nos dois (arquivamento interrompido), vale a do banco
+    # (a concatenação junta categorias diferentes; o esquema as refaz)
+    return aplicar_esquema_pedidos(pd.concat([recentes, arquivados], ignore_index=True).drop_duplicates("ID"))
+
+def pedidos_concluidos(funcionario=None, periodo=None, busca=None):
+    # O arquivamento altera a versão, então ela também vale como chave do arquivo
+    return cache_obter(
+        ("concluidos", funcionario, periodo, busca),
+        versao_pedidos(),
+        lambda: _ler_concluidos(funcionario, periodo, busca)
+    )
+
+def _ordenar_pedidos(df, ordem):
+    """Aplica em um DataFrame de exibição uma ordenação de ORDENACOES_PEDIDOS."""
+    colunas = {campo: coluna for coluna, campo in CAMPOS_PEDIDOS.items()}
+    chaves, crescente = [], []
+    for termo in ordem.split(","):
+        partes = termo.split()
+        chaves.append(colunas[partes[0]])
+        crescente.append(len(partes) == 1 or partes[1].upper() != "DESC")
+    return df.sort_values(chaves, ascending=crescente, kind="stable")
+
+# ============================================
+# MÉTRICAS
+# ============================================
+# Agregados mantidos na mesma transação de cada escrita; o painel lê só eles,
+# então o custo de exibição não cresce com o histórico.
+def _contar(conn, funcionario, status, delta):
+    conn.execute(
+        "INSERT INTO metricas_contagem (funcionario, status, quantidade) VALUES (?, ?, ?) "
+        "ON CONFLICT (funcionario, status) DO UPDATE SET quantidade = quantidade + excluded.quantidade",
+        (funcionario or "", status, delta)
+    )
+
+def _faixa_lead(segundos):
+    return int(math.log(max(segundos, 1.0), FATOR_FAIXA_LEAD))
+
+def _registrar_conclusao(conn, funcionario, inicio, fim):
+    """Conta a conclusão na vazão da hora e, com início conhecido, no lead time."""
+    lead = max(fim - inicio, 0.0) if inicio is not None else None
+    conn.execute(
+        "INSERT INTO metricas_hora (hora, concluidos, com_lead, soma_lead) VALUES (?, 1, ?, ?) "
+        "ON CONFLICT (hora) DO UPDATE SET concluidos = concluidos + 1, "
+        "com_lead = com_lead + excluded.com_lead, soma_lead = soma_lead + excluded.soma_lead",
+        (int(fim // 3600), int(lead is not None), lead or 0.0)
+    )
+    if lead is None:
+        return
+    conn.execute(
+        "INSERT INTO metricas_lead (faixa, quantidade, soma) VALUES (?, 1, ?) "
+        "ON CONFLICT (faixa) DO UPDATE SET quantidade = quantidade + 1, soma = soma + excluded.soma",
+        (_faixa_lead(lead), lead)
+    )
+    conn.execute(
+        "INSERT INTO metricas_funcionario (funcionario, concluidos, soma_lead) VALUES (?, 1, ?) "
+        "ON CONFLICT (funcionario) DO UPDATE SET concluidos = concluidos + 1, soma_lead = soma_lead + excluded.soma_lead",
+        (funcionario or "", lead)
+    )
+
+def _metricas_substituir(conn, linhas):
+    """Ajusta os agregados para linhas gravadas por INSERT OR REPLACE em salvar_pedidos."""
+    indice = COLUNAS_PEDIDOS.index
+    anteriores = {}
+    ids = [linha[indice("ID")] for linha in linhas]
+    for lote in _em_lotes(ids):
+        for linha in conn.execute(
+            f"SELECT id, funcionario, status FROM pedidos WHERE id IN ({', '.join('?' * len(lote))})", lote
+        ):
+            anteriores[linha["id"]] = linha
+    
+    for linha in linhas:
+        funcionario, status = linha[indice("Funcionário")], linha[indice("Status")]
+        anterior = anteriores.get(linha[indice("ID")])
+        if anterior is not None:
+            _contar(conn, anterior["funcionario"], anterior["status"], -1)
+        _contar(conn, funcionario, status, 1)
+        if status == "Concluído" and linha[indice("Data Conclusão")] is not None and (
+            anterior is None or anterior["status"] != "Concluído"
+        ):
+            _registrar_conclusao(conn, funcionario, linha[indice("Data Início")], linha[indice("Data Conclusão")])
+
+def recalcular_metricas(conn):
+    """Refaz todos os agregados a partir da tabela de pedidos (migração e reparo)."""
+    conn.execute("DELETE FROM metricas_contagem")
+    conn.execute("DELETE FROM metricas_hora")
+    conn.execute("DELETE FROM metricas_lead")
+    conn.execute("DELETE FROM metricas_funcionario")
+    conn.execute(
+        "INSERT INTO metricas_contagem (funcionario, status, quantidade) "
+        "SELECT COALESCE(funcionario, ''), status, COUNT(*) FROM pedidos GROUP BY 1, 2"
+    )
+    for funcionario, inicio, fim in conn.execute(
+        "SELECT funcionario, data_inicio, data_conclusao FROM pedidos "
+        "WHERE status = 'Concluído' AND data_conclusao IS NOT NULL"
+    ).fetchall():
+        _registrar_conclusao(conn, funcionario, inicio, fim)
+
+def _percentil_histograma(faixas, total, fracao):
+    alvo = fracao * total
+    acumulado = 0
+    for faixa, quantidade in faixas:
+        acumulado += quantidade
+        if acumulado >= alvo:
+            return FATOR_FAIXA_LEAD ** (faixa + 0.5)
+    return 0.0
+
+def metricas_painel(horas=HORAS_PAINEL):
+    """Vazão por hora, lead time (média e percentis), WIP e backlog, só dos agregados."""
+    conn = conectar_banco()
+    conn.execute("BEGIN")  # todos os números do mesmo snapshot
+    try:
+        hora_atual = int(time() // 3600)
+        por_hora = dict(conn.execute(
+            "SELECT hora, concluidos FROM metricas_hora WHERE hora > ?", (hora_atual - horas,)
+        ).fetchall())
+        faixas = conn.execute("SELECT faixa, quantidade FROM metricas_lead ORDER BY faixa").fetchall()
+        total_lead, soma_lead = conn.execute(
+            "SELECT COALESCE(SUM(quantidade), 0), COALESCE(SUM(soma), 0) FROM metricas_lead"
+        ).fetchone()
+        contagens = conn.execute(
+            "SELECT funcionario, status, quantidade FROM metricas_contagem WHERE quantidade > 0"
+        ).fetchall()
+    finally:
+        conn.execute("COMMIT")
+    
+    vazao = pd.DataFrame({
+        "Hora": [datetime.fromtimestamp(h * 3600).strftime("%d/%m %Hh") for h in range(hora_atual - horas + 1, hora_atual + 1)],
+        "Concluídos": [por_hora.get(h, 0) for h in range(hora_atual - horas + 1, hora_atual + 1)]
+    })
+    elenco = elenco_funcionarios()
+    backlog, wip = defaultdict(int), defaultdict(lambda: defaultdict(int))
+    for funcionario, status, quantidade in contagens:
+        backlog[status] += quantidade
+        if status in STATUS_ABERTOS and funcionario:
+            wip[funcionario][status] += quantidade
+    return {
+        "vazao": vazao,
+        "lead_medio": soma_lead / total_lead if total_lead else 0.0,
+        "lead_percentis": {p: _percentil_histograma(faixas, total_lead, p / 100) for p in (50, 90, 95)},
+        "concluidos_com_lead": total_lead,
+        "backlog": {status: backlog.get(status, 0) for status in CORES_STATUS},
+        "wip": pd.DataFrame(
+            sorted([nome_funcionario(chave, elenco)] + [wip[chave][status] for status in STATUS_ABERTOS] for chave in wip),
+            columns=["Funcionário"] + list(STATUS_ABERTOS)
+        )
+    }
+
+# ============================================
+# DESIGNAÇÃO AUTOMÁTICA
+# ============================================
+@recurso_do_processo
+def _motor_designacao():
+    # Fila de prioridade (heap) de funcionários pela espera estimada de um novo pedido.
+    # Entradas antigas ficam no heap e são descartadas ao sair (geração desatualizada).
+    return {
+        "lock": threading.Lock(),
+        "sincronizado_em": 0.0,
+        "versao_pedidos": None,
+        "versao_usuarios": None,
+        "candidatos": set(),
+        "profundidade": defaultdict(int),
+        "duracoes": None,  # nome -> [soma_segundos, quantidade]
+        "heap": [],
+        "geracao": defaultdict(int)
+    }
+
+def _duracao_media(motor, nome):
+    # Média suavizada: poucas conclusões (ou muito rápidas) não zeram a estimativa
+    soma, quantidade = motor["duracoes"].get(nome, (0.0, 0))
+    padrao = DURACAO_PADRAO_MINUTOS * 60
+    return max((soma + padrao * 3) / (quantidade + 3), 60.0)
+
+def _empurrar_candidato(motor, nome, extra=0):
+    motor["geracao"][nome] += 1
+    espera = (motor["profundidade"][nome] + extra + 1) * _duracao_media(motor, nome)
+    heapq.heappush(motor["heap"], (espera, nome, motor["geracao"][nome]))
+
+def _sincronizar_motor(motor, versao):
+    """Recarrega candidatos, filas abertas e durações dos agregados e refaz o heap.
+
+    Os agregados têm uma linha por funcionário (e status), então a releitura é
+    barata; ela acontece quando a versão do banco muda por uma escrita que o
+    motor não acompanhou (outros processos, importações, manutenção).
+    """
+    elenco = elenco_funcionarios()
+    motor["candidatos"] = set(elenco["chaves"])
+    motor["versao_usuarios"] = elenco["versao"]
+    
+    conn = conectar_banco()
+    marcadores = ", ".join("?" * len(STATUS_ABERTOS))
+    motor["profundidade"] = defaultdict(int, conn.execute(
+        f"SELECT funcionario, SUM(quantidade) FROM metricas_contagem WHERE status IN ({marcadores}) GROUP BY funcionario",
+        STATUS_ABERTOS
+    ).fetchall())
+    motor["duracoes"] = {
+        nome: [soma, quantidade]
+        for nome, quantidade, soma in conn.execute(
+            "SELECT funcionario, concluidos, soma_lead FROM metricas_funcionario"
+        )
+    }
+    motor["versao_pedidos"] = versao
+    
+    motor["heap"] = []
+    for nome in motor["candidatos"]:
+        _empurrar_candidato(motor, nome)
+    motor["sincronizado_em"] = time()
+
+def _retirar_menor(motor):
+    while motor["heap"]:
+        espera, nome, geracao = heapq.heappop(motor["heap"])
+        if nome in motor["candidatos"] and motor["geracao"][nome] == geracao:
+            return nome
+    return None
+
+def escolher_funcionarios(quantidade=1, excluir=()):
+    """Sugere `quantidade` designações, uma a uma, sempre para a menor espera estimada.
+
+    A espera é (pedidos abertos + 1) x tempo médio de conclusão do funcionário;
+    cada escolha custa O(log n) no heap. Nada é gravado: as filas só mudam
+    quando os pedidos são de fato criados ou redesignados.
+    """
+    motor = _motor_designacao()
+    versao = versao_pedidos()
+    with motor["lock"]:
+        if (time() - motor["sincronizado_em"] > INTERVALO_SINCRONIZACAO_MOTOR
+                or motor["versao_pedidos"] != versao
+                or motor["versao_usuarios"] != versao_usuarios()):
+            _sincronizar_motor(motor, versao)
+        
+        extras, ignorados, escolhidos = defaultdict(int), [], []
+        while len(escolhidos) < quantidade:
+            nome = _retirar_menor(motor)
+            if nome is None:
+                break
+            if nome in excluir:
+                ignorados.append(nome)
+                continue
+            escolhidos.append(nome)
+            extras[nome] += 1
+            _empurrar_candidato(motor, nome, extras[nome])
+        # Devolve as entradas à pontuação real (as escolhas ainda não foram gravadas)
+        for nome in set(extras) | set(ignorados):
+            _empurrar_candidato(motor, nome)
+        if len(motor["heap"]) > 4 * len(motor["candidatos"]) + 16:
+            motor["heap"] = [e for e in motor["heap"] if motor["geracao"][e[1]] == e[2]]
+            heapq.heapify(motor["heap"])
+    return escolhidos
+
+def motor_registrar_alteracoes(alteracoes):
+    """Ajusta as filas do motor depois de uma escrita já confirmada no banco.
+
+    `alteracoes` traz (funcionário antes, status antes, funcionário depois,
+    status depois, duração) de cada linha da escrita. Só vale se o motor estava
+    exatamente na versão anterior a ela; havendo outra escrita no meio (de outro
+    processo, por exemplo), a versão não bate e a próxima escolha ressincroniza.
+    """
+    versao = getattr(_conexoes(), "versao_escrita", None)
+    motor = _motor_designacao()
+    with motor["lock"]:
+        if motor["duracoes"] is None or versao is None or motor["versao_pedidos"] != versao - 1:
+            return
+        for funcionario_antes, status_antes, funcionario_depois, status_depois, duracao in alteracoes:
+            if funcionario_antes is not None and status_antes in STATUS_ABERTOS:
+                motor["profundidade"][funcionario_antes] -= 1
+            if funcionario_depois is not None and status_depois in STATUS_ABERTOS:
+                motor["profundidade"][funcionario_depois] += 1
+            if duracao is not None and funcionario_depois is not None:
+                acumulado = motor["duracoes"].setdefault(funcionario_depois, [0.0, 0])
+                acumulado[0] += max(duracao, 0)
+                acumulado[1] += 1
+            for nome in {funcionario_antes, funcionario_depois} & motor["candidatos"]:
+                _empurrar_candidato(motor, nome)
+        motor["versao_pedidos"] = versao
+
+def motor_invalidar():
+    motor = _motor_designacao()
+    with motor["lock"]:
+        motor["sincronizado_em"] = 0.0
+
+def redistribuir_pendentes(funcionario):
+    """Passa os pedidos pendentes do funcionário para os outros, pela menor espera."""
+    pendentes = carregar_pedidos(funcionario=funcionario, status="Pendente")
+    destinos = escolher_funcionarios(len(pendentes), excluir={funcionario})
+    movidos = conflitos = 0
+    for linha, destino in zip(pendentes.to_dict("records"), destinos):
+        try:
+            editar_pedido(linha["ID"], funcionario=destino, versao_esperada=linha[COLUNA_VERSAO])
+            movidos += 1
+        except ConflitoEdicao:
+            conflitos += 1
+    return movidos, conflitos
 
 # ============================================
 # FUNÇÕES AUXILIARES
@@ -159,15 +2388,256 @@ def darken_color(hex_color, factor=0.2):
     rgb = [int(x * (1 - factor)) for x in rgb]
     return f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
 
-def to_excel(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Pedidos')
-    return output.getvalue()
+# Calculadas uma vez ao carregar o módulo, em vez de a cada cartão
+CORES_STATUS_ESCURAS = {status: darken_color(cor) for status, cor in CORES_STATUS.items()}
+COR_PADRAO = "#FFFFFF"
+COR_PADRAO_ESCURA = darken_color(COR_PADRAO)
+# Colunas que definem o HTML de um cartão (chave do cache de cartões)
+COLUNAS_CARTAO = ["ID", "Pedido", "Funcionário", "Status", "Data Início", "Data Conclusão", "Prioridade", "Prazo"]
+MAX_CARTOES_EM_CACHE = 5000
+
+def _texto_html(valor):
+    return "" if pd.isna(valor) else escape(str(valor))
+
+def _data_html(valor):
+    return "" if pd.isna(valor) else valor.strftime(FORMATO_DATA)
+
+def _paragrafo_cartao(rotulo, texto):
+    return f"<p><strong>{rotulo}:</strong> {texto}</p>" if texto else ""
+
+def _montar_cartao_html(linha, modelo):
+    """HTML (já escapado) do cabeçalho e dos detalhes do cartão de uma linha (dict)."""
+    status = _texto_html(linha["Status"])
+    cor = CORES_STATUS.get(status, COR_PADRAO)
+    if modelo == "lider":
+        cabecalho = (
+            f'<div style="background-color:{cor}; padding:12px; border-radius:10px; margin-bottom:15px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">'
+            f'<div style="font-size:18px; font-weight:bold; margin-bottom:8px;">Pedido #{_texto_html(linha["Pedido"])}</div>'
+            '<div style="display:flex; justify-content:space-between; margin-bottom:10px;">'
+            f'<span>Funcionário: {_texto_html(linha["Funcionário"])}</span>'
+            f'<span style="background-color:{CORES_STATUS_ESCURAS.get(status, COR_PADRAO_ESCURA)}; padding:2px 8px; border-radius:4px;">{status}</span>'
+            '</div>'
+        )
+    else:
+        cabecalho = (
+            f'<div style="background-color:{cor}; padding:12px; border-radius:10px; margin-bottom:15px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">'
+            f'<div style="font-size:16px; font-weight:bold; margin-bottom:8px;">Pedido #{_texto_html(linha["Pedido"])}</div>'
+            '<div style="display:flex; justify-content:space-between; margin-bottom:10px;">'
+            f'<span>Status: {status}</span>'
+            '</div>'
+        )
+    detalhes = (
+        _paragrafo_cartao("Prioridade", _texto_html(PRIORIDADES.get(linha["Prioridade"])))
+        + _paragrafo_cartao("Prazo", _data_html(linha["Prazo"]) if status != "Concluído" else "")
+        + _paragrafo_cartao("Iniciado em", _data_html(linha["Data Início"]))
+        + _paragrafo_cartao("Concluído em", _data_html(linha["Data Conclusão"]))
+    )
+    return cabecalho, detalhes
+
+def gerar_cartoes_html(df, modelo="lider"):
+    """HTML (já escapado) dos cartões de todas as linhas do DataFrame, indexado por ID.
+
+    Cada cartão fica num LRU do processo, indexado pelo conteúdo da linha: páginas,
+    filas e releituras de um cartão compartilham as entradas, e só as linhas que
+    mudaram são refeitas.
+    """
+    nomes = elenco_funcionarios()["nomes"]
+    colunas = {coluna: df[coluna].tolist() for coluna in COLUNAS_CARTAO}
+    colunas["Funcionário"] = [nomes.get(chave, chave) if isinstance(chave, str) else "" for chave in colunas["Funcionário"]]
+    linhas = list(zip(*colunas.values()))
+    chaves = [(modelo, *linha) for linha in linhas]
+    
+    cache = _cache_dados()
+    with cache["lock"]:
+        lru = cache["cartoes"]
+        html = [lru.get(chave) for chave in chaves]
+        faltando = [i for i, cartao in enumerate(html) if cartao is None]
+        for chave, cartao in zip(chaves, html):
+            if cartao is not None:
+                lru.move_to_end(chave)
+        cache["acertos"] += len(chaves) - len(faltando)
+        cache["falhas"] += len(faltando)
+    
+    if faltando:
+        novos = [_montar_cartao_html(dict(zip(COLUNAS_CARTAO, linhas[i])), modelo) for i in faltando]
+        with cache["lock"]:
+            for i, cartao in zip(faltando, novos):
+                html[i] = cartao
+                lru[chaves[i]] = cartao
+            while len(lru) > MAX_CARTOES_EM_CACHE:
+                lru.popitem(last=False)
+    return pd.DataFrame(html, columns=["cabecalho", "detalhes"], index=colunas["ID"])
+
+def avisar_conflito(atual):
+    """Aviso de ConflitoEdicao; `atual` é a linha gravada agora (None se foi excluída)."""
+    if atual is None:
+        st.warning("Este pedido foi excluído por outra pessoa. Atualize a página.")
+    else:
+        st.warning(
+            f"Este pedido foi alterado por outra pessoa (agora: {atual['status']}, "
+            f"{nome_funcionario(atual['funcionario'])}). Nada foi salvo; revise e tente novamente."
+        )
+
+def formatar_duracao(segundos):
+    minutos = int(segundos // 60)
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas}h {minutos:02d}min" if horas else f"{minutos}min"
+
+# ============================================
+# RELATÓRIOS
+# ============================================
+@recurso_do_processo
+def _relatorios():
+    # Relatórios gerados (ou em geração) por filtro, compartilhados entre as sessões;
+    # "leitores" conta os downloads em andamento de cada arquivo e "obsoletos" guarda
+    # os substituídos que só serão apagados quando o último download terminar
+    return {
+        "lock": threading.Lock(),
+        "executor": ThreadPoolExecutor(max_workers=2, thread_name_prefix="relatorios"),
+        "tarefas": {},
+        "leitores": Counter(),
+        "obsoletos": set()
+    }
+
+def _lotes_relatorio(funcionario=None, status=None, periodo=None, busca=None):
+    """Lê os pedidos filtrados em lotes direto do cursor, sem montar um DataFrame.
+
+    Sem filtro de status ou com "Concluído", acrescenta os concluídos arquivados
+    do `periodo`, uma partição mensal por vez.
+    """
+    where, params = _filtros_sql(funcionario, status, busca)
+    cursor = conectar_banco().execute(
+        "SELECT " + COLUNAS_SELECT_PEDIDOS + " FROM pedidos" + where + " ORDER BY id", params
+    )
+    nomes = elenco_funcionarios()["nomes"]
+    posicao = COLUNAS_PEDIDOS.index("Funcionário")
+    posicao_prioridade = COLUNAS_PEDIDOS.index("Prioridade")
+    vistos = set()
+    while True:
+        lote = cursor.fetchmany(TAMANHO_LOTE_EXPORTACAO)
+        if not lote:
+            break
+        vistos.update(linha[0] for linha in lote)
+        linhas = [["" if valor is None else valor for valor in linha] for linha in lote]
+        for linha in linhas:
+            linha[posicao] = nomes.get(linha[posicao], linha[posicao])
+            linha[posicao_prioridade] = PRIORIDADES.get(linha[posicao_prioridade], linha[posicao_prioridade])
+        yield linhas
+    
+    if status not in (None, "Concluído"):
+        return
+    for caminho in _particoes_busca(periodo, busca):
+        df = pd.read_parquet(caminho, filters=_filtros_arquivo(funcionario, periodo, busca))
+        df = _arquivo_para_exibicao(df[~df["id"].isin(vistos)])
+        df["Funcionário"] = df["Funcionário"].astype(str).map(lambda chave: nomes.get(chave, chave))
+        df["Prioridade"] = df["Prioridade"].map(PRIORIDADES)
+        for coluna in COLUNAS_DATA:
+            df[coluna] = formatar_datas(df[coluna])
+        linhas = df[COLUNAS_PEDIDOS].astype(object).values.tolist()
+        for inicio in range(0, len(linhas), TAMANHO_LOTE_EXPORTACAO):
+            yield linhas[inicio:inicio + TAMANHO_LOTE_EXPORTACAO]
+
+@medir
+def exportar_csv(caminho, lotes):
+    with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS_PEDIDOS)
+        for lote in lotes:
+            escritor.writerows(lote)
+
+@medir
+def exportar_excel(caminho, lotes):
+    # constant_memory grava cada linha no disco assim que a próxima começa
+    livro = xlsxwriter.Workbook(caminho, {"constant_memory": True})
+    planilha = livro.add_worksheet("Pedidos")
+    planilha.write_row(0, 0, COLUNAS_PEDIDOS)
+    numero_linha = 1
+    for lote in lotes:
+        for linha in lote:
+            planilha.write_row(numero_linha, 0, linha)
+            numero_linha += 1
+    livro.close()
+
+FORMATOS_RELATORIO = {
+    "xlsx": (exportar_excel, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": (exportar_csv, "text/csv")
+}
+
+def _gerar_relatorio(formato, funcionario, status, periodo, busca, caminho):
+    parcial = caminho + ".parcial"
+    FORMATOS_RELATORIO[formato][0](parcial, _lotes_relatorio(funcionario, status, periodo, busca))
+    os.replace(parcial, caminho)
+    return caminho
+
+def _apagar_relatorio(futuro):
+    try:
+        os.remove(futuro.result())
+    except Exception:
+        pass
+
+def solicitar_relatorio(formato, funcionario=None, status=None, periodo=None, busca=None, reservar=False):
+    """Future com o caminho do relatório para os filtros na versão atual dos dados.
+
+    Pedidos repetidos com os mesmos filtros reaproveitam o arquivo já gerado (ou
+    a geração em andamento); arquivos de versões antigas são apagados assim que
+    nenhum download os estiver lendo. Com `reservar`, o arquivo fica reservado
+    até `_liberar_relatorio` (use relatorio_reservado).
+    """
+    versao = versao_pedidos()
+    chave = (formato, funcionario, status, periodo, busca)
+    registro = _relatorios()
+    with registro["lock"]:
+        anterior = registro["tarefas"].get(chave)
+        if anterior is not None and anterior[0] == versao:
+            futuro = anterior[1]
+            anterior = None
+        else:
+            os.makedirs(PASTA_RELATORIOS, exist_ok=True)
+            nome = hashlib.sha1(repr((chave, versao, os.getpid())).encode()).hexdigest()
+            caminho = os.path.join(PASTA_RELATORIOS, f"{nome}.{formato}")
+            futuro = registro["executor"].submit(_gerar_relatorio, formato, funcionario, status, periodo, busca, caminho)
+            registro["tarefas"][chave] = (versao, futuro)
+            if anterior is not None and registro["leitores"][anterior[1]]:
+                registro["obsoletos"].add(anterior[1])
+                anterior = None  # o último leitor apaga
+        if reservar:
+            registro["leitores"][futuro] += 1
+    
+    if anterior is not None:
+        anterior[1].add_done_callback(_apagar_relatorio)
+    return futuro
+
+def _liberar_relatorio(futuro):
+    registro = _relatorios()
+    with registro["lock"]:
+        registro["leitores"][futuro] -= 1
+        if registro["leitores"][futuro] > 0:
+            return
+        del registro["leitores"][futuro]
+        if futuro not in registro["obsoletos"]:
+            return
+        registro["obsoletos"].discard(futuro)
+    futuro.add_done_callback(_apagar_relatorio)
+
+@contextmanager
+def relatorio_reservado(formato, funcionario=None, status=None, periodo=None, busca=None):
+    """Caminho do relatório gerado; o arquivo não é apagado enquanto o bloco estiver aberto."""
+    futuro = solicitar_relatorio(formato, funcionario, status, periodo, busca, reservar=True)
+    try:
+        yield futuro.result()
+    finally:
+        _liberar_relatorio(futuro)
+
+def baixar_relatorio(formato, funcionario=None, status=None, periodo=None, busca=None):
+    """Conteúdo do relatório; chamado pelo download_button só quando o usuário clica."""
+    with relatorio_reservado(formato, funcionario, status, periodo, busca) as caminho:
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
 
 # ============================================
 # TELAS DO SISTEMA
 # ============================================
+@medir
 def tela_login():
     st.title("🔐 Sistema de Pedidos - Login")
     
@@ -182,9 +2652,9 @@ def tela_login():
             else:
                 st.error("Credenciais inválidas")
 
+@medir
 def tela_gerenciar_usuarios():
     st.title("👥 Gerenciamento de Usuários")
-    st.session_state.last_activity = time()
     
     usuarios_df = carregar_usuarios()
     usuarios_lista = usuarios_df["username"].tolist()
@@ -271,30 +2741,35 @@ def tela_gerenciar_usuarios():
                         if not username or not nome_completo or (modo == "criar" and not st.session_state["usuario_editando"]["password"]):
                             st.error("Preencha todos os campos obrigatórios (*)")
                         else:
+                            # O hash é calculado fora da trava; a alteração relê o arquivo atual
+                            senha = st.session_state["usuario_editando"].get("password")
+                            novo_hash = gerar_hash_senha(senha) if senha else None
                             if modo == "editar":
-                                usuarios_df.loc[usuarios_df["username"] == username, "nome_completo"] = nome_completo
-                                usuarios_df.loc[usuarios_df["username"] == username, "role"] = role
-                                if "password" in st.session_state["usuario_editando"]:
-                                    usuarios_df.loc[usuarios_df["username"] == username, "password"] = hashlib.sha256(
-                                        st.session_state["usuario_editando"]["password"].encode()
-                                    ).hexdigest()
-                                salvar_usuarios(usuarios_df)
+                                def editar(usuarios):
+                                    filtro = usuarios["username"] == username
+                                    usuarios.loc[filtro, "nome_completo"] = nome_completo
+                                    usuarios.loc[filtro, "role"] = role
+                                    if novo_hash:
+                                        usuarios.loc[filtro, "password"] = novo_hash
+                                    return usuarios
+                                alterar_usuarios(editar)
                                 st.success("Usuário atualizado com sucesso!")
                             else:
-                                if username in usuarios_lista:
-                                    st.error("Nome de usuário já existe")
-                                else:
+                                def criar(usuarios):
+                                    if username in usuarios["username"].astype(str).tolist():
+                                        raise ValueError("Nome de usuário já existe")
                                     novo_usuario = pd.DataFrame([{
                                         "username": username,
-                                        "password": hashlib.sha256(
-                                            st.session_state["usuario_editando"]["password"].encode()
-                                        ).hexdigest(),
+                                        "password": novo_hash,
                                         "role": role,
                                         "nome_completo": nome_completo
                                     }])
-                                    usuarios_df = pd.concat([usuarios_df, novo_usuario], ignore_index=True)
-                                    salvar_usuarios(usuarios_df)
+                                    return pd.concat([usuarios, novo_usuario], ignore_index=True)
+                                try:
+                                    alterar_usuarios(criar)
                                     st.success("Usuário criado com sucesso!")
+                                except ValueError as erro:
+                                    st.error(str(erro))
                             
                             st.session_state.pop("usuario_editando")
                             st.rerun()
@@ -303,151 +2778,458 @@ def tela_gerenciar_usuarios():
                     if modo == "editar":
                         if st.form_submit_button("🗑️ Excluir Usuário"):
                             username = st.session_state["usuario_editando"]["username"]
-                            role = st.session_state["usuario_editando"]["role"]
                             
-                            if role == "lider" and len(usuarios_df[usuarios_df["role"] == "lider"]) <= 1:
-                                st.error("Não é possível remover o último líder")
-                            else:
-                                usuarios_df = usuarios_df[usuarios_df["username"] != username]
-                                salvar_usuarios(usuarios_df)
+                            def excluir(usuarios):
+                                lideres = usuarios.loc[usuarios["role"] == "lider", "username"].tolist()
+                                if username in lideres and len(lideres) <= 1:
+                                    raise ValueError("Não é possível remover o último líder")
+                                return usuarios[usuarios["username"] != username]
+                            try:
+                                alterar_usuarios(excluir)
                                 st.success("Usuário removido com sucesso!")
                                 st.session_state.pop("usuario_editando")
                                 st.rerun()
+                            except ValueError as erro:
+                                st.error(str(erro))
                     else:
                         if st.form_submit_button("❌ Cancelar"):
                             st.session_state.pop("usuario_editando")
                             st.rerun()
 
+# ============================================
+# CARTÕES DE PEDIDO
+# ============================================
+# Cada cartão é um fragmento: os botões gravam só aquela linha num callback e
+# relêem só aquele pedido, então o clique reexecuta apenas o próprio cartão.
+def _conferir_sessao():
+    """Renova a sessão fora da execução completa (fragmentos e callbacks); False se acabou."""
+    st.session_state.sessao_conferida_em = time()
+    token = st.session_state.get("token_sessao")
+    if token and tocar_sessao(token) is not None:
+        return True
+    st.session_state.sessao_invalida = True
+    return False
+
+def _estado_cartao(row, cartao, tempo, modelo):
+    """Linha, HTML e tempo trabalhado a exibir; (None, None, 0) se o pedido foi excluído."""
+    # Reexecuções só do fragmento não passam pelo main: a sessão é renovada aqui,
+    # no mesmo intervalo do toque, e uma sessão encerrada volta para o login
+    if time() - st.session_state.get("sessao_conferida_em", 0) > INTERVALO_TOQUE_SESSAO:
+        _conferir_sessao()
+    if st.session_state.pop("sessao_invalida", False):
+        st.rerun()
+    mensagem = st.session_state.setdefault("toasts_cartao", {}).pop(row["ID"], None)
+    if mensagem:
+        st.toast(mensagem)
+    relido = st.session_state.setdefault("cartoes_relidos", {}).get(row["ID"])
+    if relido is None:
+        return row, cartao, tempo
+    if relido.empty:
+        return None, None, 0
+    cartao = gerar_cartoes_html(relido, modelo).iloc[0].to_dict()
+    return relido.to_dict("records")[0], cartao, tempos_trabalhados([row["ID"]]).get(row["ID"], 0)
+
+def _acao_cartao(id_pedido, mensagem, operacao, *args, **kwargs):
+    """Callback dos botões do cartão: grava e relê só este pedido antes do fragmento ser redesenhado."""
+    if not _conferir_sessao():
+        return
+    try:
+        operacao(id_pedido, *args, **kwargs)
+    except ConflitoEdicao as erro:
+        # Só dados simples na sessão: a classe é redefinida a cada execução completa
+        st.session_state.setdefault("avisos_cartao", {})[id_pedido] = ("conflito", erro.atual)
+        return
+    st.session_state.setdefault("cartoes_relidos", {})[id_pedido] = ler_pedido(id_pedido)
+    # O toast sai no corpo do fragmento (_estado_cartao): callbacks de fragmento não exibem elementos
+    st.session_state.setdefault("toasts_cartao", {})[id_pedido] = mensagem
+
+def _avisar_cartao(id_pedido):
+    aviso = st.session_state.setdefault("avisos_cartao", {}).pop(id_pedido, None)
+    if aviso is None:
+        return
+    tipo, conteudo = aviso
+    if tipo == "conflito":
+        avisar_conflito(conteudo)
+    else:
+        st.warning(conteudo)
+
+def _detalhes_cartao(cartao, tempo):
+    trabalhado = f"<p><strong>Tempo trabalhado:</strong> {formatar_duracao(tempo)}</p>" if tempo else ""
+    st.markdown(
+        f'<div style="padding:8px;">{cartao["detalhes"]}{trabalhado}</div>',
+        unsafe_allow_html=True
+    )
+
+def _salvar_cartao_lider(id_pedido, funcionario, status, prioridade, versao):
+    novo_funcionario = st.session_state[f"func_{id_pedido}"]
+    novo_status = st.session_state[f"status_{id_pedido}"]
+    nova_prioridade = st.session_state[f"prio_{id_pedido}"]
+    if funcionario != novo_funcionario or status != novo_status or prioridade != nova_prioridade:
+        _acao_cartao(
+            id_pedido, "Alterações salvas!", editar_pedido,
+            funcionario=novo_funcionario,
+            status=novo_status if status != novo_status else None,
+            versao_esperada=versao,
+            prioridade=nova_prioridade
+        )
+
+@st.fragment
+@medir
+def cartao_pedido_lider(row, cartao, tempo, arquivado=False):
+    numero = row["Pedido"]
+    row, cartao, tempo = _estado_cartao(row, cartao, tempo, "lider")
+    if row is None:
+        st.caption(f"Pedido #{numero} excluído.")
+        return
+    
+    with st.container():
+        st.markdown(cartao["cabecalho"], unsafe_allow_html=True)
+        
+        with st.expander("🔍 Ver detalhes", expanded=False):
+            _detalhes_cartao(cartao, tempo)
+            if arquivado:
+                # Fora do banco não há edição (as gravações só alcançam a tabela pedidos)
+                st.caption("Pedido arquivado: somente leitura.")
+            else:
+                _controles_cartao_lider(row)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def _controles_cartao_lider(row):
+    elenco = elenco_funcionarios()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.selectbox(
+            "Designar para",
+            elenco["chaves"],
+            index=elenco["posicoes"].get(row["Funcionário"], 0),
+            format_func=lambda chave: elenco["nomes"].get(chave, chave),
+            key=f"func_{row['ID']}"
+        )
+    with col2:
+        st.selectbox(
+            "Status",
+            list(CORES_STATUS.keys()),
+            index=list(CORES_STATUS.keys()).index(row["Status"]),
+            key=f"status_{row['ID']}"
+        )
+    with col3:
+        st.selectbox(
+            "Prioridade",
+            list(PRIORIDADES),
+            index=list(PRIORIDADES).index(int(row["Prioridade"])),
+            format_func=PRIORIDADES.get,
+            key=f"prio_{row['ID']}"
+        )
+    
+    col4, col5 = st.columns(2)
+    col4.button(
+        "💾 Salvar", key=f"save_{row['ID']}", on_click=_salvar_cartao_lider,
+        args=(row["ID"], row["Funcionário"], row["Status"], int(row["Prioridade"]), row[COLUNA_VERSAO])
+    )
+    col5.button(
+        "🗑️ Excluir", key=f"del_{row['ID']}", on_click=_acao_cartao,
+        args=(row["ID"], "Pedido excluído!", excluir_pedido),
+        kwargs={"versao_esperada": row[COLUNA_VERSAO]}
+    )
+    _avisar_cartao(row["ID"])
+
+@medir
 def tela_pedidos_lider():
     st.title("📋 Gerenciamento de Pedidos")
-    st.session_state.last_activity = time()
+    # Execução completa: a página é relida do banco, os cartões voltam a usar a linha dela
+    st.session_state.cartoes_relidos = {}
 
     with st.expander("➕ Novo Pedido", expanded=True):
         col1, col2 = st.columns(2)
         num_pedido = col1.text_input("Número do Pedido*", key="novo_pedido_num")
-        funcionarios = carregar_usuarios()
-        funcionarios = funcionarios[funcionarios["role"] == "funcionario"]["nome_completo"].tolist()
-        funcionario = col2.selectbox("Designar para*", funcionarios, key="novo_pedido_func")
+        # Opções são usernames; o elenco em cache dá o nome e a posição de cada um
+        elenco = elenco_funcionarios()
+        funcionarios = elenco["chaves"]
+        nome = lambda chave: elenco["nomes"].get(chave, chave)
+        funcionario = col2.selectbox(
+            "Designar para*", [DESIGNACAO_AUTOMATICA] + funcionarios, format_func=nome, key="novo_pedido_func"
+        )
+        col3, col4 = st.columns(2)
+        prioridade = col3.selectbox(
+            "Prioridade", list(PRIORIDADES), index=PRIORIDADE_PADRAO, format_func=PRIORIDADES.get, key="novo_pedido_prio"
+        )
+        horas_prazo = col4.number_input(
+            "Prazo (horas)", min_value=1, value=PRAZO_PADRAO_HORAS[prioridade], key=f"novo_pedido_prazo_{prioridade}"
+        )
 
         if st.button("Adicionar", key="btn_adicionar_pedido"):
-            if num_pedido and num_pedido.isdigit():
-                adicionar_pedido(int(num_pedido), funcionario)
-                st.success("Pedido adicionado!")
-                st.rerun()
+            if num_pedido and num_pedido.isdigit() and int(num_pedido) <= MAX_PEDIDO:
+                if funcionario == DESIGNACAO_AUTOMATICA:
+                    sugeridos = escolher_funcionarios(1)
+                    funcionario = sugeridos[0] if sugeridos else None
+                if funcionario:
+                    adicionar_pedido(int(num_pedido), funcionario, prioridade, time() + horas_prazo * 3600)
+                    st.success(f"Pedido adicionado para {nome(funcionario)}!")
+                    st.rerun()
+                else:
+                    st.error("Nenhum funcionário cadastrado para receber o pedido")
             else:
                 st.error("Número de pedido inválido")
 
+    with st.expander("📥 Importar pedidos em lote", expanded=False):
+        arquivo = st.file_uploader("Planilha (CSV ou XLSX)", type=["csv", "xlsx"], key="importar_arquivo")
+        texto = st.text_area("Ou cole os números (um por linha, vírgula ou espaço)", key="importar_texto")
+        destino = st.selectbox("Designar para", [DESIGNACAO_AUTOMATICA] + funcionarios, format_func=nome, key="importar_destino")
+        prioridade_lote = st.selectbox(
+            "Prioridade", list(PRIORIDADES), index=PRIORIDADE_PADRAO, format_func=PRIORIDADES.get, key="importar_prio"
+        )
+        
+        if st.button("Importar", key="btn_importar"):
+            valores = ler_numeros_texto(texto)
+            if arquivo is not None:
+                valores += ler_numeros_arquivo(arquivo)
+            numeros, invalidos, repetidos = interpretar_numeros_pedido(valores)
+            if not numeros:
+                st.error("Nenhum número de pedido válido informado")
+            else:
+                try:
+                    criados, existentes = importar_pedidos(
+                        numeros, None if destino == DESIGNACAO_AUTOMATICA else destino, prioridade_lote
+                    )
+                    st.success(f"{criados} pedido(s) importado(s)")
+                    if existentes:
+                        st.warning(f"{len(existentes)} pedido(s) já existiam e foram ignorados")
+                except ValueError as erro:
+                    st.error(str(erro))
+            if invalidos:
+                st.warning(f"{len(invalidos)} entrada(s) inválida(s) ignorada(s): {', '.join(invalidos[:10])}")
+            if repetidos:
+                st.info(f"{repetidos} número(s) repetido(s) na entrada")
+
+    with st.expander("⚖️ Redistribuir pendentes", expanded=False):
+        col1, col2 = st.columns([2, 1])
+        origem = col1.selectbox("Pendentes de", funcionarios, format_func=nome, key="redistribuir_origem")
+        col2.write("")
+        if col2.button("Redistribuir", key="btn_redistribuir") and origem:
+            movidos, conflitos = redistribuir_pendentes(origem)
+            st.success(f"{movidos} pedido(s) redistribuído(s)")
+            if conflitos:
+                st.warning(f"{conflitos} pedido(s) mudaram durante a operação e foram mantidos")
+
     st.subheader("🔍 Filtros Avançados")
-    pedidos_df = carregar_pedidos()
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
-        filtro_funcionario = st.selectbox(
-            "Funcionário",
-            ["Todos"] + sorted(pedidos_df["Funcionário"].unique().tolist()) if not pedidos_df.empty else ["Todos"]
-        )
+        filtro_funcionario = st.selectbox("Funcionário", ["Todos"] + funcionarios_com_pedidos(), format_func=nome)
     with col2:
         filtro_status = st.selectbox("Status", ["Todos"] + list(CORES_STATUS.keys()))
+    with col3:
+        ordenacao = st.selectbox("Ordenar por", list(ORDENACOES_PEDIDOS.keys()))
 
-    if filtro_funcionario != "Todos":
-        pedidos_df = pedidos_df[pedidos_df["Funcionário"] == filtro_funcionario]
-    if filtro_status != "Todos":
-        pedidos_df = pedidos_df[pedidos_df["Status"] == filtro_status]
+    funcionario_filtro = None if filtro_funcionario == "Todos" else filtro_funcionario
+    status_filtro = None if filtro_status == "Todos" else filtro_status
+    
+    # Prefixo e intervalos de datas viram faixas nos índices do banco (e filtros no arquivo)
+    hoje = datetime.now().date()
+    col1, col2 = st.columns(2)
+    prefixo = col1.text_input("Número começa com", key="busca_prefixo")
+    rotulos_datas = col2.multiselect("Filtrar por data de", list(DATAS_BUSCA.keys()), key="busca_datas")
+    intervalos = {}
+    for rotulo in rotulos_datas:
+        datas = st.date_input(
+            f"{rotulo} entre",
+            (hoje - pd.Timedelta(days=DIAS_PERIODO_PADRAO), hoje),
+            format="DD/MM/YYYY",
+            key=f"busca_{DATAS_BUSCA[rotulo]}"
+        )
+        if len(datas) == 2:
+            intervalos[DATAS_BUSCA[rotulo]] = intervalo_datas(datas)
+    try:
+        busca = montar_busca(prefixo, intervalos)
+    except ValueError as erro:
+        st.error(str(erro))
+        busca = None
+    
+    # Concluídos antigos ficam no arquivo mensal; o período limita as partições lidas
+    periodo = None
+    if status_filtro == "Concluído":
+        datas = st.date_input(
+            "Concluídos entre",
+            (hoje - pd.Timedelta(days=DIAS_PERIODO_PADRAO), hoje),
+            format="DD/MM/YYYY"
+        )
+        if len(datas) == 2:
+            periodo = intervalo_datas(datas)
+    elif status_filtro is None:
+        st.caption(
+            f"Concluídos há mais de {ATRASO_ARQUIVAMENTO_HORAS}h ficam no arquivo: "
+            "filtre por \"Concluído\" para consultá-los."
+        )
 
+    # Os relatórios só são gerados quando alguém clica (em outra thread)
     st.write("")
     col1, col2 = st.columns(2)
     with col1:
         st.download_button(
             label="📥 Baixar Relatório Completo (Excel)",
-            data=to_excel(pedidos_df),
+            data=lambda: baixar_relatorio("xlsx", funcionario_filtro, status_filtro, periodo, busca),
             file_name='relatorio_pedidos.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            mime=FORMATOS_RELATORIO["xlsx"][1]
         )
     with col2:
         st.download_button(
             label="📥 Baixar Relatório Completo (CSV)",
-            data=pedidos_df.to_csv(index=False).encode('utf-8'),
+            data=lambda: baixar_relatorio("csv", funcionario_filtro, status_filtro, periodo, busca),
             file_name='relatorio_pedidos.csv',
-            mime='text/csv'
+            mime=FORMATOS_RELATORIO["csv"][1]
         )
 
     st.subheader("📝 Todos os Pedidos")
 
-    if not pedidos_df.empty:
-        for _, row in pedidos_df.iterrows():
-            cor_status = CORES_STATUS.get(row["Status"], "#FFFFFF")
+    total = contar_pedidos(funcionario_filtro, status_filtro, periodo, busca)
+    col1, col2, col3 = st.columns([1, 1, 2])
+    tamanho_pagina = col1.selectbox(
+        "Pedidos por página",
+        OPCOES_TAMANHO_PAGINA,
+        index=OPCOES_TAMANHO_PAGINA.index(TAMANHO_PAGINA_PADRAO)
+    )
+    total_paginas = max(1, -(-total // tamanho_pagina))
+    pagina = col2.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1)
+    col3.caption(f"{total} pedido(s) encontrado(s)")
+    
+    pagina_df = listar_pedidos(
+        funcionario_filtro, status_filtro, ordenacao, tamanho_pagina, (pagina - 1) * tamanho_pagina, periodo, busca
+    )
+
+    if not pagina_df.empty:
+        arquivados = ids_arquivados(pagina_df.loc[pagina_df["Status"] == "Concluído", "ID"])
+        with st.expander("☑️ Ações em lote", expanded=False):
+            editaveis = pagina_df[~pagina_df["ID"].isin(arquivados)]
+            versoes = dict(zip(editaveis["ID"], editaveis[COLUNA_VERSAO]))
+            rotulos = dict(zip(editaveis["ID"], editaveis["Pedido"]))
+            todos = st.checkbox("Selecionar todos da página", key="lote_todos")
+            selecionados = list(versoes) if todos else st.multiselect(
+                "Pedidos", list(versoes), format_func=lambda i: f"#{rotulos[i]}", key="lote_selecionados"
+            )
             
-            with st.container():
-                st.markdown(
-                    f'<div style="background-color:{cor_status}; padding:12px; border-radius:10px; margin-bottom:15px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">'
-                    f'<div style="font-size:18px; font-weight:bold; margin-bottom:8px;">Pedido #{row["Pedido"]}</div>'
-                    f'<div style="display:flex; justify-content:space-between; margin-bottom:10px;">'
-                    f'<span>Funcionário: {row["Funcionário"]}</span>'
-                    f'<span style="background-color:{darken_color(cor_status)}; padding:2px 8px; border-radius:4px;">{row["Status"]}</span>'
-                    f'</div>',
-                    unsafe_allow_html=True
-                )
-                
-                with st.expander("🔍 Ver detalhes", expanded=False):
-                    st.markdown(
-                        f'<div style="padding:8px;">'
-                        f'{f"<p><strong>Iniciado em:</strong> {row['Data Início']}</p>" if row["Data Início"] else ""}'
-                        f'{f"<p><strong>Concluído em:</strong> {row['Data Conclusão']}</p>" if row["Data Conclusão"] else ""}'
-                        '</div>',
-                        unsafe_allow_html=True
-                    )
-                    
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        novo_funcionario = st.selectbox(
-                            "Designar para",
-                            funcionarios,
-                            index=funcionarios.index(row["Funcionário"]) if row["Funcionário"] in funcionarios else 0,
-                            key=f"func_{row['ID']}"
-                        )
-                    with col2:
-                        novo_status = st.selectbox(
-                            "Status",
-                            list(CORES_STATUS.keys()),
-                            index=list(CORES_STATUS.keys()).index(row["Status"]),
-                            key=f"status_{row['ID']}"
-                        )
-                    
-                    col4, col5 = st.columns(2)
-                    with col4:
-                        if st.button("💾 Salvar", key=f"save_{row['ID']}"):
-                            if row["Funcionário"] != novo_funcionario or row["Status"] != novo_status:
-                                pedidos_df.loc[pedidos_df["ID"] == row["ID"], "Funcionário"] = novo_funcionario
-                                atualizar_status_pedido(row["ID"], novo_status)
-                                st.success("Alterações salvas!")
-                                st.rerun()
-                    with col5:
-                        if st.button("🗑️ Excluir", key=f"del_{row['ID']}"):
-                            pedidos_df = pedidos_df[pedidos_df["ID"] != row["ID"]]
-                            salvar_pedidos(pedidos_df)
-                            st.success("Pedido excluído!")
-                            st.rerun()
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+            col1, col2 = st.columns(2)
+            acao = col1.selectbox("Ação", ["Alterar status", "Redesignar", "Excluir"], key="lote_acao")
+            if acao == "Alterar status":
+                parametro = col2.selectbox("Novo status", list(CORES_STATUS.keys()), key="lote_status")
+            elif acao == "Redesignar":
+                parametro = col2.selectbox("Designar para", funcionarios, format_func=nome, key="lote_funcionario")
+            
+            if st.button("Aplicar", key="btn_lote_aplicar") and selecionados:
+                escolhidos = {i: versoes[i] for i in selecionados}
+                if acao == "Alterar status":
+                    alterados, conflitos = editar_pedidos_em_lote(escolhidos, status=parametro)
+                elif acao == "Redesignar":
+                    alterados, conflitos = editar_pedidos_em_lote(escolhidos, funcionario=parametro)
+                else:
+                    alterados, conflitos = excluir_pedidos_em_lote(escolhidos)
+                st.success(f"{alterados} pedido(s) atualizado(s)")
+                if conflitos:
+                    st.warning(f"{conflitos} pedido(s) foram alterados por outra pessoa e mantidos")
+                else:
+                    st.rerun()
+        
+        tempos = tempos_trabalhados(pagina_df["ID"].tolist())
+        cartoes = gerar_cartoes_html(pagina_df, "lider")
+        for row in pagina_df.to_dict("records"):
+            cartao_pedido_lider(row, cartoes.loc[row["ID"]].to_dict(), tempos.get(row["ID"], 0), row["ID"] in arquivados)
     else:
         st.info("Nenhum pedido encontrado com os filtros selecionados.")
 
+def atualizar_meus_pedidos(funcionario):
+    """Fila do funcionário mantida na sessão e atualizada só com o que mudou."""
+    fila = st.session_state.get("meus_pedidos")
+    desde = fila["versao"] if fila and fila["funcionario"] == funcionario else None
+    versao, alterados, removidos, completo = pedidos_abertos_funcionario(funcionario, desde)
+    
+    linhas = {} if completo else fila["linhas"]
+    for id_pedido in removidos:
+        linhas.pop(id_pedido, None)
+    for linha in alterados.to_dict("records"):
+        if linha["Status"] == "Concluído":
+            linhas.pop(linha["ID"], None)
+        else:
+            linhas[linha["ID"]] = linha
+    
+    st.session_state.meus_pedidos = {"funcionario": funcionario, "versao": versao, "linhas": linhas}
+    ordem = sorted(linhas.values(), key=chave_urgencia)
+    return aplicar_esquema_pedidos(pd.DataFrame(ordem, columns=COLUNAS_PEDIDOS + [COLUNA_VERSAO]))
+
+@st.fragment(run_every=INTERVALO_NOTIFICACOES)
+def verificar_notificacoes(funcionario):
+    # Roda sozinho a cada INTERVALO_NOTIFICACOES; só recarrega a tela quando há mensagem nova
+    novas = notificacoes_desde(funcionario, st.session_state.seq_notificacoes)
+    if novas:
+        st.session_state.seq_notificacoes = novas[-1]["seq"]
+        st.session_state.notificacoes_pendentes.extend(novas)
+        st.rerun()
+
+# Status de origem aceitos por cada botão do cartão do funcionário
+ACOES_FUNCIONARIO = {
+    "Em andamento": (["Pendente", "Pausado"], "Pedido iniciado!", "Ação não permitida"),
+    "Pausado": (["Em andamento"], "Pedido pausado!", "Só pausar em andamento"),
+    "Concluído": (["Em andamento", "Pausado"], "Pedido finalizado!", "Só finalizar em andamento/pausado"),
+}
+
+def _mudar_status_cartao(id_pedido, status_atual, novo_status, versao):
+    permitidos, mensagem, recusa = ACOES_FUNCIONARIO[novo_status]
+    if status_atual in permitidos:
+        _acao_cartao(id_pedido, mensagem, atualizar_status_pedido, novo_status, versao)
+    else:
+        st.session_state.setdefault("avisos_cartao", {})[id_pedido] = ("recusa", recusa)
+
+@st.fragment
+@medir
+def cartao_pedido_funcionario(row, cartao, tempo):
+    numero = row["Pedido"]
+    row, cartao, tempo = _estado_cartao(row, cartao, tempo, "funcionario")
+    if row is None or row["Funcionário"] != st.session_state.user_info["username"]:
+        st.caption(f"Pedido #{numero} não está mais com você.")
+        return
+    if row["Status"] == "Concluído":
+        st.caption(f"✅ Pedido #{numero} finalizado.")
+        return
+    
+    with st.container():
+        st.markdown(cartao["cabecalho"], unsafe_allow_html=True)
+        
+        with st.expander("🔍 Ver detalhes", expanded=False):
+            _detalhes_cartao(cartao, tempo)
+            
+            colunas = st.columns(3)
+            botoes = [("▶️ Iniciar", "iniciar", "Em andamento"), ("⏸️ Pausar", "pausar", "Pausado"), ("✅ Finalizar", "finalizar", "Concluído")]
+            for coluna, (rotulo, chave, novo_status) in zip(colunas, botoes):
+                coluna.button(
+                    rotulo, key=f"{chave}_{row['ID']}", on_click=_mudar_status_cartao,
+                    args=(row["ID"], row["Status"], novo_status, row[COLUNA_VERSAO])
+                )
+            _avisar_cartao(row["ID"])
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+@medir
 def tela_pedidos_funcionario():
+    if "seq_notificacoes" not in st.session_state:
+        st.session_state.seq_notificacoes = seq_notificacoes()
+    st.session_state.cartoes_relidos = {}
+    
     # Botão para atualizar pedidos
     if st.button("🔄 Atualizar Pedidos", key="btn_atualizar_pedidos"):
-        st.session_state.notificado = False  # Permite mostrar notificações novamente
         st.rerun()
     
-    # Verifica novos pedidos
-    if (st.session_state.ultimo_pedido and 
-        st.session_state.ultimo_pedido["funcionario"] == st.session_state.user_info["nome_completo"] and
-        not st.session_state.notificado):
-        
-        st.toast(
-            f"📢 Novo pedido #{st.session_state.ultimo_pedido['numero']} atribuído a você!",
-            icon="⚠️"
-        )
-        st.session_state.notificado = True
+    verificar_notificacoes(st.session_state.user_info["username"])
+    for msg in st.session_state.notificacoes_pendentes:
+        if msg["tipo"] == "novo":
+            st.toast(f"📢 Novo pedido #{msg['numero']} atribuído a você!", icon="⚠️")
+        elif msg["tipo"] == "lote":
+            st.toast(f"📢 {msg['numero']} novos pedidos atribuídos a você!", icon="⚠️")
+        elif msg["tipo"] == "escalado":
+            st.toast(f"Pedido #{msg['numero']} está perto do prazo!", icon="⏰")
+        elif msg["tipo"] == "removidos":
+            st.toast(f"{msg['numero']} pedidos saíram da sua fila", icon="ℹ️")
+        else:
+            st.toast(f"Pedido #{msg['numero']} foi designado a outra pessoa", icon="ℹ️")
+    st.session_state.notificacoes_pendentes = []
     
     # Título com fonte menor
     st.markdown(
@@ -455,84 +3237,110 @@ def tela_pedidos_funcionario():
         unsafe_allow_html=True
     )
     
-    st.session_state.last_activity = time()
-    
-    pedidos_df = carregar_pedidos()
-    meus_pedidos = pedidos_df[(pedidos_df["Funcionário"] == st.session_state.user_info["nome_completo"]) & 
-                             (pedidos_df["Status"] != "Concluído")]
+    meus_pedidos = atualizar_meus_pedidos(st.session_state.user_info["username"])
     
     if not meus_pedidos.empty:
-        for _, row in meus_pedidos.iterrows():
-            cor_status = CORES_STATUS.get(row["Status"], "#FFFFFF")
-            
-            with st.container():
-                st.markdown(
-                    f'<div style="background-color:{cor_status}; padding:12px; border-radius:10px; margin-bottom:15px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">'
-                    f'<div style="font-size:16px; font-weight:bold; margin-bottom:8px;">Pedido #{row["Pedido"]}</div>'
-                    f'<div style="display:flex; justify-content:space-between; margin-bottom:10px;">'
-                    f'<span>Status: {row["Status"]}</span>'
-                    f'</div>',
-                    unsafe_allow_html=True
-                )
-                
-                with st.expander("🔍 Ver detalhes", expanded=False):
-                    st.markdown(
-                        f'<div style="padding:8px;">'
-                        f'{f"<p><strong>Iniciado em:</strong> {row['Data Início']}</p>" if row["Data Início"] else ""}'
-                        f'{f"<p><strong>Concluído em:</strong> {row['Data Conclusão']}</p>" if row["Data Conclusão"] else ""}'
-                        '</div>',
-                        unsafe_allow_html=True
-                    )
-                    
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        if st.button("▶️ Iniciar", key=f"iniciar_{row['ID']}"):
-                            if row["Status"] in ["Pendente", "Pausado"]:
-                                if atualizar_status_pedido(row["ID"], "Em andamento"):
-                                    st.success("Pedido iniciado!")
-                                    st.rerun()
-                            else:
-                                st.warning("Ação não permitida")
-                    with col2:
-                        if st.button("⏸️ Pausar", key=f"pausar_{row['ID']}"):
-                            if row["Status"] == "Em andamento":
-                                if atualizar_status_pedido(row["ID"], "Pausado"):
-                                    st.success("Pedido pausado!")
-                                    st.rerun()
-                            else:
-                                st.warning("Só pausar em andamento")
-                    with col3:
-                        if st.button("✅ Finalizar", key=f"finalizar_{row['ID']}"):
-                            if row["Status"] in ["Em andamento", "Pausado"]:
-                                if atualizar_status_pedido(row["ID"], "Concluído"):
-                                    st.success("Pedido finalizado!")
-                                    st.rerun()
-                            else:
-                                st.warning("Só finalizar em andamento/pausado")
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+        tempos = tempos_trabalhados(meus_pedidos["ID"].tolist())
+        cartoes = gerar_cartoes_html(meus_pedidos, "funcionario")
+        for row in meus_pedidos.to_dict("records"):
+            cartao_pedido_funcionario(row, cartoes.loc[row["ID"]].to_dict(), tempos.get(row["ID"], 0))
     else:
         st.info("Nenhum pedido atribuído a você")
 
+@medir
+def tela_painel():
+    st.title("📊 Painel Operacional")
+    metricas = metricas_painel()
+    
+    colunas = st.columns(len(metricas["backlog"]))
+    for coluna, (status, quantidade) in zip(colunas, metricas["backlog"].items()):
+        coluna.metric(status, quantidade)
+    
+    st.subheader(f"Vazão (concluídos por hora, últimas {HORAS_PAINEL}h)")
+    st.bar_chart(metricas["vazao"], x="Hora", y="Concluídos")
+    
+    st.subheader("Lead time (início → conclusão)")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Média", formatar_duracao(metricas["lead_medio"]))
+    col2.metric("P50", formatar_duracao(metricas["lead_percentis"][50]))
+    col3.metric("P90", formatar_duracao(metricas["lead_percentis"][90]))
+    col4.metric("P95", formatar_duracao(metricas["lead_percentis"][95]))
+    st.caption(f"{metricas['concluidos_com_lead']} conclusão(ões) com início registrado")
+    
+    st.subheader("Trabalho em andamento por funcionário")
+    if metricas["wip"].empty:
+        st.info("Nenhum pedido em aberto.")
+    else:
+        st.dataframe(metricas["wip"], hide_index=True, width="stretch")
+
+    st.subheader("⏰ Prazos mais próximos")
+    risco = pedidos_em_risco()
+    if risco.empty:
+        st.info("Nenhum pedido em aberto com prazo.")
+    else:
+        nomes = elenco_funcionarios()["nomes"]
+        limite = pd.Timestamp(datetime.fromtimestamp(time() + ANTECEDENCIA_ESCALONAMENTO_MINUTOS * 60))
+        tabela = pd.DataFrame({
+            "Pedido": risco["Pedido"],
+            "Funcionário": risco["Funcionário"].astype(object).map(lambda chave: nomes.get(chave, chave)),
+            "Status": risco["Status"],
+            "Prioridade": risco["Prioridade"].map(PRIORIDADES),
+            "Prazo": formatar_datas(risco["Prazo"]),
+            "Em risco": np.where(risco["Prazo"] <= limite, "⚠️", "")
+        })
+        st.dataframe(tabela, hide_index=True, width="stretch")
+
+def painel_depuracao():
+    st.divider()
+    st.subheader("🛠️ Depuração")
+    
+    tempos = tempos_operacoes()
+    tabela = pd.DataFrame(
+        [
+            [nome, medida["quantidade"], medida["soma"] / medida["quantidade"] * 1000, medida["maximo"] * 1000, medida["soma"]]
+            for nome, medida in tempos.items()
+        ],
+        columns=["Operação", "Chamadas", "Média (ms)", "Máximo (ms)", "Total (s)"]
+    ).sort_values("Total (s)", ascending=False)
+    st.dataframe(tabela, hide_index=True, width="stretch")
+    
+    col1, col2 = st.columns(2)
+    col1.download_button("📥 Métricas (Prometheus)", data=metricas_prometheus, file_name="metricas.txt", mime="text/plain")
+    col2.download_button("📥 Métricas (JSON)", data=metricas_json, file_name="metricas.json", mime="application/json")
+    cache = estatisticas_cache()
+    st.caption(
+        f"Cache: {cache['entradas']} entradas, {cache['acertos']} acertos, {cache['falhas']} falhas "
+        f"({cache['taxa_acerto']:.0%} de acerto)"
+        + (f" · métricas em http://127.0.0.1:{PORTA_METRICAS}/metrics" if PORTA_METRICAS else "")
+    )
+    
+    perfil = st.session_state.get("ultimo_perfil")
+    if perfil is not None:
+        st.caption(f"Perfil da última execução: {perfil['duracao'] * 1000:.0f} ms, {perfil['amostras']} amostras")
+        st.dataframe(perfil["funcoes"], hide_index=True, width="stretch")
+
+@medir
 def tela_principal():
     st.sidebar.title(f"👋 Olá, {st.session_state.user_info['nome_completo']}")
     st.sidebar.subheader(f"Perfil: {'Líder' if st.session_state.user_info['role'] == 'lider' else 'Funcionário'}")
     
     if st.sidebar.button("🚪 Sair"):
+        encerrar_sessao(st.session_state.get("token_sessao"))
         st.session_state.clear()
-        js_logout = """
-        <script>
-        window.localStorage.clear();
-        </script>
-        """
-        html(js_logout)
+        st.query_params.clear()
         st.rerun()
     
     if st.session_state.user_info["role"] == "lider":
-        opcao = st.sidebar.radio("Menu", ["📋 Pedidos", "👥 Usuários"])
+        usuarios, sessoes = usuarios_ativos()
+        st.sidebar.caption(f"🟢 {usuarios} usuário(s) ativo(s) em {sessoes} sessão(ões)")
+        if st.sidebar.toggle("🛠️ Depuração", key="depuracao"):
+            st.sidebar.toggle("Perfilar cada execução", key="perfilar")
+        opcao = st.sidebar.radio("Menu", ["📋 Pedidos", "📊 Painel", "👥 Usuários"])
         
         if opcao == "📋 Pedidos":
             tela_pedidos_lider()
+        elif opcao == "📊 Painel":
+            tela_painel()
         else:
             tela_gerenciar_usuarios()
     else:
@@ -545,36 +3353,38 @@ def main():
     st.set_page_config(page_title="Sistema de Pedidos", layout="wide")
     inicializar_arquivos()
     
-    # Verifica se já está autenticado
-    if st.session_state.get("autenticado", False):
-        # Verifica timeout apenas se autenticado
-        inactive_seconds = time() - st.session_state.last_activity
-        if inactive_seconds > TIMEOUT_MINUTOS * 60:
-            st.warning(f"Sessão encerrada após {TIMEOUT_MINUTOS} minutos de inatividade")
-            st.session_state.clear()
-            st.rerun()
-        else:
+    # A sessão vive no servidor; o token na URL a recupera depois de um recarregamento
+    # e é trocado por um novo a cada recuperação (ver retomar_sessao)
+    token = st.session_state.get("token_sessao")
+    usuario = tocar_sessao(token) if token else None
+    st.session_state.sessao_conferida_em = time()
+    st.session_state.pop("sessao_invalida", None)
+    if token is None and st.query_params.get("sessao"):
+        token, usuario = retomar_sessao(st.query_params["sessao"])
+        if token:
+            st.query_params["sessao"] = token
+    if usuario is not None:
+        st.session_state.token_sessao = token
+        st.session_state.autenticado = True
+        st.session_state.user_info = usuario
+        # Perfilador opcional: amostra a pilha desta execução inteira
+        perfil = iniciar_amostragem() if st.session_state.get("perfilar") else None
+        try:
             tela_principal()
+        finally:
+            if perfil is not None:
+                st.session_state.ultimo_perfil = parar_amostragem(perfil)
+        if st.session_state.get("depuracao"):
+            painel_depuracao()
     else:
+        if token or st.query_params.get("sessao"):
+            if st.session_state.get("autenticado", False):
+                st.warning(f"Sessão encerrada após {TIMEOUT_MINUTOS} minutos de inatividade")
+            st.session_state.autenticado = False
+            st.session_state.user_info = None
+            st.session_state.pop("token_sessao", None)
+            st.query_params.pop("sessao", None)
         tela_login()
 
-    # Script JavaScript para manter a sessão
-    js = """
-    <script>
-    // Armazena o session_id no localStorage
-    if (!window.localStorage.getItem('session_id')) {
-        window.localStorage.setItem('session_id', '%s');
-    }
-    
-    // Verifica se o session_id mudou (página recarregada em outra aba)
-    if (window.localStorage.getItem('session_id') !== '%s') {
-        window.localStorage.clear();
-        window.location.reload();
-    }
-    </script>
-    """ % (st.session_state.session_id, st.session_state.session_id)
-    
-    html(js)
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,598 @@
+"""Benchmarks do Sistema de Pedidos.
+
+Uso:
+    python benchmark.py cartoes --linhas 100 1000 10000
+    python benchmark.py cartoes --json resultados.json
+    python benchmark.py carga --linhas 1000 100000 --lideres 3 --funcionarios 30 --duracao 20
+    python benchmark.py carga --linhas 1000000 --sem-cas --json carga.json
+    python benchmark.py memoria --linhas 100000 1000000
+    python benchmark.py busca --linhas 100000 1000000
+    python benchmark.py processos --processos 4 --duracao 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import streamlit.logger
+
+# Importar app.py fora do `streamlit run` gera avisos de contexto a cada acesso ao session_state
+streamlit.logger.set_log_level("error")
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+
+FUNCIONARIOS = [f"Funcionário {i:02d}" for i in range(30)]
+
+
+def dados_sinteticos(linhas, semente=42):
+    """DataFrame de pedidos no formato de `carregar_pedidos`, com datas plausíveis."""
+    aleatorio = random.Random(semente)
+    inicio = datetime(2024, 1, 1)
+    registros = []
+    for i in range(1, linhas + 1):
+        status = aleatorio.choice(list(app.CORES_STATUS))
+        criado = inicio + timedelta(minutes=7 * i)
+        iniciado = criado + timedelta(minutes=aleatorio.randint(1, 120)) if status != "Pendente" else None
+        concluido = iniciado + timedelta(minutes=aleatorio.randint(5, 240)) if status == "Concluído" else None
+        prioridade = aleatorio.choice(list(app.PRIORIDADES))
+        prazo = criado + timedelta(hours=app.PRAZO_PADRAO_HORAS[prioridade])
+        registros.append({
+            "ID": i,
+            "Pedido": 100000 + i,
+            "Funcionário": aleatorio.choice(FUNCIONARIOS),
+            "Status": status,
+            "Data Criação": criado.strftime("%d/%m/%Y %H:%M"),
+            "Data Designação": criado.strftime("%d/%m/%Y %H:%M"),
+            "Data Início": iniciado.strftime("%d/%m/%Y %H:%M") if iniciado else "",
+            "Data Conclusão": concluido.strftime("%d/%m/%Y %H:%M") if concluido else "",
+            "Prioridade": prioridade,
+            "Prazo": prazo.strftime("%d/%m/%Y %H:%M")
+        })
+    return app.aplicar_esquema_pedidos(pd.DataFrame(registros, columns=app.COLUNAS_PEDIDOS))
+
+
+def _cartao_linha_a_linha(row):
+    # Caminho antigo: f-string por linha e darken_color a cada cartão
+    cor_status = app.CORES_STATUS.get(row["Status"], "#FFFFFF")
+    cabecalho = (
+        f'<div style="background-color:{cor_status}; padding:12px; border-radius:10px; margin-bottom:15px; box-shadow:0 2px 4px rgba(0,0,0,0.1);">'
+        f'<div style="font-size:18px; font-weight:bold; margin-bottom:8px;">Pedido #{row["Pedido"]}</div>'
+        f'<div style="display:flex; justify-content:space-between; margin-bottom:10px;">'
+        f'<span>Funcionário: {row["Funcionário"]}</span>'
+        f'<span style="background-color:{app.darken_color(cor_status)}; padding:2px 8px; border-radius:4px;">{row["Status"]}</span>'
+        f'</div>'
+    )
+    inicio = f"<p><strong>Iniciado em:</strong> {row['Data Início']:%d/%m/%Y %H:%M}</p>" if pd.notna(row["Data Início"]) else ""
+    conclusao = f"<p><strong>Concluído em:</strong> {row['Data Conclusão']:%d/%m/%Y %H:%M}</p>" if pd.notna(row["Data Conclusão"]) else ""
+    return cabecalho, inicio + conclusao
+
+
+def _cronometrar(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = perf_counter()
+        funcao()
+        melhor = min(melhor, perf_counter() - inicio)
+    return melhor
+
+
+def benchmark_cartoes(linhas, repeticoes=5):
+    resultados = []
+    for n in linhas:
+        df = dados_sinteticos(n)
+        app.cache_invalidar("cartoes")
+        registros = df[app.COLUNAS_CARTAO].to_dict("records")
+        tempos = {
+            "linha_a_linha": _cronometrar(lambda: [_cartao_linha_a_linha(r) for _, r in df.iterrows()], repeticoes),
+            "por_linha": _cronometrar(lambda: [app._montar_cartao_html(r, "lider") for r in registros], repeticoes),
+            "sem_cache": _cronometrar(lambda: (app.cache_invalidar("cartoes"), app.gerar_cartoes_html(df, "lider")), repeticoes),
+        }
+        app.gerar_cartoes_html(df, "lider")
+        tempos["em_cache"] = _cronometrar(lambda: app.gerar_cartoes_html(df, "lider"), repeticoes)
+        resultados.append({
+            "linhas": n,
+            **{f"us_por_cartao_{nome}": segundos / n * 1e6 for nome, segundos in tempos.items()}
+        })
+    return resultados
+
+
+def _representacao_antiga(df):
+    # Como carregar_pedidos devolvia antes do esquema tipado: int64, textos e datas em texto
+    antigo = df.astype({"ID": "int64", "Pedido": "int64", "Funcionário": object, "Status": object})
+    for coluna in app.COLUNAS_DATA:
+        antigo[coluna] = app.formatar_datas(df[coluna]).astype(object)
+    return antigo
+
+
+def benchmark_memoria(linhas, repeticoes=5):
+    """Memória do DataFrame de pedidos e custo de um filtro por status e funcionário."""
+    resultados = []
+    for n in linhas:
+        tipado = dados_sinteticos(n)
+        antigo = _representacao_antiga(tipado)
+        resultado = {"linhas": n}
+        for nome, df in (("antes", antigo), ("depois", tipado)):
+            filtro = lambda: df[(df["Status"] == "Pendente") & (df["Funcionário"] == FUNCIONARIOS[0])]
+            resultado[f"mb_por_100k_{nome}"] = df.memory_usage(deep=True).sum() / n * 100000 / 2**20
+            resultado[f"ms_filtro_{nome}"] = _cronometrar(filtro, repeticoes) * 1000
+        resultado["reducao_memoria"] = resultado["mb_por_100k_antes"] / resultado["mb_por_100k_depois"]
+        resultado["reducao_filtro"] = resultado["ms_filtro_antes"] / resultado["ms_filtro_depois"]
+        resultados.append(resultado)
+    return resultados
+
+
+def _apontar_para(pasta):
+    app.DB_PEDIDOS = os.path.join(pasta, "pedidos.db")
+    app.DB_USUARIOS = os.path.join(pasta, "usuarios.csv")
+    app.PASTA_ARQUIVO = os.path.join(pasta, "arquivo_pedidos")
+
+
+def preparar_banco(pasta, linhas, lote=50000):
+    """Cria em `pasta` um pedidos.db com `linhas` pedidos sintéticos e o usuarios.csv dos FUNCIONARIOS."""
+    _apontar_para(pasta)
+    # Conexões e caches do processo apontam para o banco anterior
+    app._conexoes.clear()
+    app._cache_dados.clear()
+    app.salvar_usuarios(pd.DataFrame(
+        [{"username": nome, "password": "", "role": "funcionario", "nome_completo": nome} for nome in FUNCIONARIOS]
+    ))
+    app.criar_esquema()
+    for inicio in range(0, linhas, lote):
+        df = dados_sinteticos(min(lote, linhas - inicio), semente=inicio)
+        df["ID"] += inicio
+        df["Pedido"] += inicio
+        # Cada lote continua o histórico do anterior (um pedido a cada 7 minutos)
+        for coluna in app.COLUNAS_DATA:
+            df[coluna] += pd.Timedelta(minutes=7 * inicio)
+        app.salvar_pedidos(df)
+
+
+class Coletor:
+    """Latências por operação, conflitos e leituras usadas por escritas bem-sucedidas."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.conflitos = 0
+        self.escritas = []  # (id_pedido, versão lida) de cada edição aceita
+        self.erros = []  # traceback de cada thread que morreu
+
+    def executar(self, alvo, *args):
+        """Alvo das threads: uma exceção é guardada em vez de sumir com a thread."""
+        try:
+            alvo(self, *args)
+        except Exception:
+            with self.lock:
+                self.erros.append(traceback.format_exc())
+
+    def verificar(self):
+        if self.erros:
+            raise RuntimeError(
+                f"{len(self.erros)} thread(s) falharam; os resultados não valem. Primeira falha:\n{self.erros[0]}"
+            )
+
+    def medir(self, operacao, funcao, *args, **kwargs):
+        inicio = perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        except app.ConflitoEdicao:
+            with self.lock:
+                self.conflitos += 1
+            return None
+        finally:
+            with self.lock:
+                self.latencias[operacao].append(perf_counter() - inicio)
+
+    def escrita_aceita(self, id_pedido, versao_lida):
+        with self.lock:
+            self.escritas.append((int(id_pedido), int(versao_lida)))
+
+
+def _lider(coletor, parar, semente, usar_cas):
+    aleatorio = random.Random(semente)
+    while not parar.is_set():
+        sorteio = aleatorio.random()
+        if sorteio < 0.3:
+            coletor.medir("adicionar_pedido", app.adicionar_pedido, aleatorio.randint(1, 10**7), aleatorio.choice(FUNCIONARIOS))
+            continue
+        
+        status = aleatorio.choice([None] + list(app.CORES_STATUS))
+        pagina = coletor.medir("listar_pedidos", app.listar_pedidos, None, status, "Mais recentes", app.TAMANHO_PAGINA_PADRAO, 0)
+        coletor.medir("contar_pedidos", app.contar_pedidos, None, status)
+        coletor.medir("gerar_cartoes_html", app.gerar_cartoes_html, pagina, "lider")
+        if sorteio < 0.5 and not pagina.empty:
+            linha = pagina.iloc[aleatorio.randrange(len(pagina))]
+            aceito = coletor.medir(
+                "editar_pedido", app.editar_pedido, linha["ID"],
+                funcionario=aleatorio.choice([f for f in FUNCIONARIOS if f != linha["Funcionário"]]),
+                versao_esperada=linha[app.COLUNA_VERSAO] if usar_cas else None
+            )
+            if aceito:
+                coletor.escrita_aceita(linha["ID"], linha[app.COLUNA_VERSAO])
+
+
+PROXIMOS_STATUS = {
+    "Pendente": ["Em andamento"],
+    "Em andamento": ["Pausado", "Concluído"],
+    "Pausado": ["Em andamento"]
+}
+
+
+def _funcionario(coletor, parar, nome, semente, usar_cas):
+    aleatorio = random.Random(semente)
+    versao, fila = None, {}
+    while not parar.is_set():
+        versao, alterados, removidos, completo = coletor.medir(
+            "pedidos_abertos_funcionario", app.pedidos_abertos_funcionario, nome, versao
+        )
+        if completo:
+            fila = {}
+        for id_pedido in removidos:
+            fila.pop(id_pedido, None)
+        for linha in alterados.to_dict("records"):
+            if linha["Status"] == "Concluído":
+                fila.pop(linha["ID"], None)
+            else:
+                fila[linha["ID"]] = linha
+        if not fila:
+            parar.wait(0.01)
+            continue
+        
+        linha = fila[aleatorio.choice(list(fila))]
+        aceito = coletor.medir(
+            "atualizar_status_pedido", app.atualizar_status_pedido, linha["ID"],
+            aleatorio.choice(PROXIMOS_STATUS[linha["Status"]]),
+            linha[app.COLUNA_VERSAO] if usar_cas else None
+        )
+        if aceito:
+            coletor.escrita_aceita(linha["ID"], linha[app.COLUNA_VERSAO])
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def benchmark_carga(linhas, lideres, funcionarios, duracao, usar_cas=True):
+    """Simula líderes e funcionários concorrentes direto na camada de dados."""
+    resultados = []
+    for n in linhas:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_banco(pasta, n)
+            coletor, parar = Coletor(), threading.Event()
+            threads = [
+                threading.Thread(target=coletor.executar, args=(_lider, parar, i, usar_cas)) for i in range(lideres)
+            ] + [
+                threading.Thread(
+                    target=coletor.executar,
+                    args=(_funcionario, parar, FUNCIONARIOS[i % len(FUNCIONARIOS)], 1000 + i, usar_cas)
+                )
+                for i in range(funcionarios)
+            ]
+            inicio = perf_counter()
+            for thread in threads:
+                thread.start()
+            parar.wait(duracao)
+            parar.set()
+            for thread in threads:
+                thread.join()
+            decorrido = perf_counter() - inicio
+            app._conexoes.clear()
+        coletor.verificar()
+        
+        # Duas escritas aceitas a partir da mesma leitura da mesma linha: uma apagou a outra
+        perdidas = len(coletor.escritas) - len(set(coletor.escritas))
+        operacoes = {
+            nome: {
+                "quantidade": len(valores),
+                "p50_ms": _percentil(valores, 50) * 1000,
+                "p99_ms": _percentil(valores, 99) * 1000,
+                "por_segundo": len(valores) / decorrido
+            }
+            for nome, valores in sorted(coletor.latencias.items())
+        }
+        resultados.append({
+            "linhas": n,
+            "lideres": lideres,
+            "funcionarios": funcionarios,
+            "duracao_s": decorrido,
+            "cas": usar_cas,
+            "operacoes_por_segundo": sum(len(v) for v in coletor.latencias.values()) / decorrido,
+            "escritas_aceitas": len(coletor.escritas),
+            "conflitos": coletor.conflitos,
+            "atualizacoes_perdidas": perdidas,
+            "operacoes": operacoes
+        })
+    return resultados
+
+
+def _buscas_sinteticas(linhas):
+    """Buscas sobre o histórico de `dados_sinteticos` (um pedido a cada 7 minutos)."""
+    inicio = datetime(2024, 1, 1)
+    fim = inicio + timedelta(minutes=7 * linhas)
+    meio = inicio + (fim - inicio) / 2
+    mes = (meio.timestamp(), (meio + timedelta(days=30)).timestamp())
+    semana = (meio.timestamp(), (meio + timedelta(days=7)).timestamp())
+    prefixo = str(100000 + linhas // 2)[:4]
+    return {
+        "prefixo": (None, None, app.montar_busca(prefixo)),
+        "criacao_mes": (None, None, app.montar_busca(datas={"data_criacao": mes})),
+        "inicio_semana_funcionario": (FUNCIONARIOS[0], None, app.montar_busca(datas={"data_inicio": semana})),
+        "combinada": (None, "Em andamento", app.montar_busca(prefixo[:3], {"data_criacao": mes, "data_inicio": semana})),
+    }
+
+
+def _mascara(df, funcionario, status, busca):
+    # Como os filtros eram aplicados antes: o histórico inteiro em memória, uma máscara por critério
+    mascara = pd.Series(True, index=df.index)
+    if funcionario is not None:
+        mascara &= df["Funcionário"] == funcionario
+    if status is not None:
+        mascara &= df["Status"] == status
+    prefixo, intervalos = busca
+    if prefixo:
+        mascara &= df["Pedido"].astype(str).str.startswith(prefixo)
+    colunas = {campo: coluna for coluna, campo in app.CAMPOS_PEDIDOS.items()}
+    for campo, inicio, fim in intervalos:
+        datas = df[colunas[campo]]
+        mascara &= (datas >= pd.Timestamp.fromtimestamp(inicio)) & (datas <= pd.Timestamp.fromtimestamp(fim))
+    return df[mascara]
+
+
+def benchmark_busca(linhas, repeticoes=5):
+    """Contagem + primeira página de cada busca nos índices, contra carregar tudo e mascarar."""
+    resultados = []
+    for n in linhas:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_banco(pasta, n)
+            tudo = app.carregar_pedidos()
+            for nome, (funcionario, status, busca) in _buscas_sinteticas(n).items():
+                def indexada():
+                    app.cache_invalidar()
+                    total = app.contar_pedidos(funcionario, status, busca=busca)
+                    app.listar_pedidos(funcionario, status, busca=busca)
+                    return total
+                encontrados = indexada()
+                assert encontrados == len(_mascara(tudo, funcionario, status, busca)), nome
+                resultados.append({
+                    "linhas": n,
+                    "busca": nome,
+                    "encontrados": encontrados,
+                    "ms_carregar_e_mascarar": _cronometrar(lambda: _mascara(app.carregar_pedidos(), funcionario, status, busca), 1) * 1000,
+                    "ms_indices": _cronometrar(indexada, repeticoes) * 1000,
+                })
+            app._conexoes.clear()
+    return resultados
+
+
+def _processo(pasta, indice, processos, duracao, barreira, fila):
+    try:
+        _carga_processo(pasta, indice, processos, duracao, barreira, fila)
+    except Exception:
+        # Libera os outros processos da barreira e avisa o pai, que senão esperaria para sempre
+        barreira.abort()
+        fila.put({"indice": indice, "erro": traceback.format_exc()})
+
+
+def _carga_processo(pasta, indice, processos, duracao, barreira, fila):
+    """Um processo do Streamlit: edita com CAS, cria usuários e troca notificações com o vizinho."""
+    _apontar_para(pasta)
+    aleatorio = random.Random(indice)
+    coletor = Coletor()
+    proprio, vizinho = f"proc{indice}", f"proc{(indice + 1) % processos}"
+    app.abrir_sessao({"username": proprio, "role": "funcionario", "nome_completo": proprio})
+    seq = app.seq_notificacoes()
+    # Ninguém publica antes de todos lerem o ponto de partida das notificações
+    barreira.wait()
+    enviadas = recebidas = criados = 0
+    
+    def receber():
+        nonlocal seq, recebidas
+        novas = app.notificacoes_desde(proprio, seq)
+        if novas:
+            seq = novas[-1]["seq"]
+            recebidas += len(novas)
+        return novas
+    
+    fim = perf_counter() + duracao
+    while perf_counter() < fim:
+        sorteio = aleatorio.random()
+        if sorteio < 0.05:
+            novo = pd.DataFrame([{"username": f"{proprio}_{criados}", "password": "", "role": "funcionario", "nome_completo": proprio}])
+            coletor.medir("alterar_usuarios", app.alterar_usuarios, lambda df: pd.concat([df, novo], ignore_index=True))
+            criados += 1
+        elif sorteio < 0.2:
+            coletor.medir("publicar_notificacao", app.publicar_notificacao, vizinho, "novo", 0, enviadas)
+            enviadas += 1
+        else:
+            status = aleatorio.choice(list(PROXIMOS_STATUS))
+            pagina = coletor.medir("listar_pedidos", app.listar_pedidos, None, status, "Mais recentes", app.TAMANHO_PAGINA_PADRAO, 0)
+            if not pagina.empty:
+                linha = pagina.iloc[aleatorio.randrange(len(pagina))]
+                aceito = coletor.medir(
+                    "editar_pedido", app.editar_pedido, linha["ID"],
+                    status=aleatorio.choice(PROXIMOS_STATUS[status]), versao_esperada=linha[app.COLUNA_VERSAO]
+                )
+                if aceito:
+                    coletor.escrita_aceita(linha["ID"], linha[app.COLUNA_VERSAO])
+        coletor.medir("notificacoes_desde", receber)
+    
+    # Depois que todos pararam de escrever: o que ficou em cache tem de bater com o banco
+    barreira.wait()
+    receber()
+    coerente = all(
+        app.listar_pedidos(None, status)[["ID", app.COLUNA_VERSAO]].values.tolist()
+        == app._ler_pedidos(None, status, "id DESC", app.TAMANHO_PAGINA_PADRAO)[["ID", app.COLUNA_VERSAO]].values.tolist()
+        for status in app.CORES_STATUS
+    )
+    fila.put({
+        "indice": indice,
+        "latencias": dict(coletor.latencias),
+        "escritas": coletor.escritas,
+        "conflitos": coletor.conflitos,
+        "enviadas": enviadas,
+        "recebidas": recebidas,
+        "usuarios_criados": criados,
+        "usuarios_vistos": len(app.carregar_usuarios()),
+        "sessoes_ativas": app.usuarios_ativos()[0],
+        "cache_coerente": coerente,
+    })
+
+
+def benchmark_processos(linhas, processos, duracao):
+    """Vários processos sobre o mesmo banco e o mesmo usuarios.csv, como atrás de um balanceador."""
+    contexto = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar_banco(pasta, linhas)
+        barreira, fila = contexto.Barrier(processos), contexto.Queue()
+        filhos = [
+            contexto.Process(target=_processo, args=(pasta, i, processos, duracao, barreira, fila))
+            for i in range(processos)
+        ]
+        inicio = perf_counter()
+        for filho in filhos:
+            filho.start()
+        parciais = sorted((fila.get() for _ in filhos), key=lambda r: r["indice"])
+        for filho in filhos:
+            filho.join()
+        falhas = [parcial["erro"] for parcial in parciais if "erro" in parcial]
+        if falhas:
+            raise RuntimeError(
+                f"{len(falhas)} processo(s) falharam; os resultados não valem. Primeira falha:\n{falhas[0]}"
+            )
+        decorrido = perf_counter() - inicio
+        usuarios_finais = len(app._ler_usuarios())
+        app._conexoes.clear()
+    
+    latencias = defaultdict(list)
+    for parcial in parciais:
+        for operacao, valores in parcial["latencias"].items():
+            latencias[operacao].extend(valores)
+    escritas = [escrita for parcial in parciais for escrita in parcial["escritas"]]
+    criados = sum(parcial["usuarios_criados"] for parcial in parciais)
+    return {
+        "processos": processos,
+        "linhas": linhas,
+        "duracao_s": decorrido,
+        "escritas_aceitas": len(escritas),
+        "conflitos": sum(parcial["conflitos"] for parcial in parciais),
+        "atualizacoes_perdidas": len(escritas) - len(set(escritas)),
+        "usuarios_criados": criados,
+        "usuarios_perdidos": len(FUNCIONARIOS) + criados - usuarios_finais,
+        "notificacoes_perdidas": sum(
+            parciais[i - 1]["enviadas"] - parciais[i]["recebidas"] for i in range(processos)
+        ),
+        "processos_com_cache_coerente": sum(parcial["cache_coerente"] for parcial in parciais),
+        "processos_vendo_todas_as_sessoes": sum(parcial["sessoes_ativas"] == processos for parcial in parciais),
+        "processos_vendo_todos_os_usuarios": sum(
+            parcial["usuarios_vistos"] == len(FUNCIONARIOS) + criados for parcial in parciais
+        ),
+        "operacoes": {
+            nome: {
+                "quantidade": len(valores),
+                "p50_ms": _percentil(valores, 50) * 1000,
+                "p99_ms": _percentil(valores, 99) * 1000,
+            }
+            for nome, valores in sorted(latencias.items())
+        }
+    }
+
+
+def _imprimir_processos(resultado):
+    for chave, valor in resultado.items():
+        if chave != "operacoes":
+            print(f"{chave:>36}: {valor:.2f}" if isinstance(valor, float) else f"{chave:>36}: {valor}")
+    print(f"{'operação':>28}  {'qtd':>8}  {'p50 ms':>8}  {'p99 ms':>8}")
+    for nome, medidas in resultado["operacoes"].items():
+        print(f"{nome:>28}  {medidas['quantidade']:>8}  {medidas['p50_ms']:>8.2f}  {medidas['p99_ms']:>8.2f}")
+
+
+def _imprimir_carga(resultados):
+    for resultado in resultados:
+        print(
+            f"\n{resultado['linhas']} linhas, {resultado['lideres']} líderes, {resultado['funcionarios']} funcionários, "
+            f"CAS {'ligado' if resultado['cas'] else 'desligado'}: {resultado['operacoes_por_segundo']:.0f} op/s, "
+            f"{resultado['escritas_aceitas']} escritas, {resultado['conflitos']} conflitos, "
+            f"{resultado['atualizacoes_perdidas']} atualizações perdidas"
+        )
+        print(f"{'operação':>28}  {'qtd':>8}  {'p50 ms':>8}  {'p99 ms':>8}  {'op/s':>8}")
+        for nome, medidas in resultado["operacoes"].items():
+            print(
+                f"{nome:>28}  {medidas['quantidade']:>8}  {medidas['p50_ms']:>8.2f}  "
+                f"{medidas['p99_ms']:>8.2f}  {medidas['por_segundo']:>8.1f}"
+            )
+
+
+def _imprimir(resultados):
+    colunas = list(resultados[0])
+    print("  ".join(f"{c:>30}" for c in colunas))
+    for linha in resultados:
+        print("  ".join(f"{linha[c]:>30.2f}" if isinstance(linha[c], float) else f"{linha[c]:>30}" for c in colunas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    cartoes = subparsers.add_parser("cartoes", help="custo de montar o HTML dos cartões de pedido")
+    cartoes.add_argument("--linhas", type=int, nargs="+", default=[25, 1000, 10000])
+    cartoes.add_argument("--repeticoes", type=int, default=5)
+    cartoes.add_argument("--json", help="grava os resultados neste arquivo")
+
+    memoria = subparsers.add_parser("memoria", help="memória por 100 mil pedidos antes e depois do esquema tipado")
+    memoria.add_argument("--linhas", type=int, nargs="+", default=[100000])
+    memoria.add_argument("--repeticoes", type=int, default=5)
+    memoria.add_argument("--json", help="grava os resultados neste arquivo")
+
+    carga = subparsers.add_parser("carga", help="líderes e funcionários simultâneos sobre históricos sintéticos")
+    carga.add_argument("--linhas", type=int, nargs="+", default=[1000, 100000])
+    carga.add_argument("--lideres", type=int, default=3)
+    carga.add_argument("--funcionarios", type=int, default=30)
+    carga.add_argument("--duracao", type=float, default=20, help="segundos de carga por tamanho de histórico")
+    carga.add_argument("--sem-cas", action="store_true", help="edita sem versão esperada, para medir as perdas")
+    carga.add_argument("--json", help="grava os resultados neste arquivo")
+
+    busca = subparsers.add_parser("busca", help="buscas por prefixo e datas nos índices sobre históricos de vários anos")
+    busca.add_argument("--linhas", type=int, nargs="+", default=[100000, 1000000])
+    busca.add_argument("--repeticoes", type=int, default=5)
+    busca.add_argument("--json", help="grava os resultados neste arquivo")
+
+    processos = subparsers.add_parser("processos", help="vários processos sobre o mesmo banco e usuarios.csv")
+    processos.add_argument("--processos", type=int, default=4)
+    processos.add_argument("--linhas", type=int, default=10000)
+    processos.add_argument("--duracao", type=float, default=20, help="segundos de carga")
+    processos.add_argument("--json", help="grava os resultados neste arquivo")
+
+    args = parser.parse_args()
+    if args.comando == "cartoes":
+        resultados = benchmark_cartoes(args.linhas, args.repeticoes)
+        _imprimir(resultados)
+    elif args.comando == "memoria":
+        resultados = benchmark_memoria(args.linhas, args.repeticoes)
+        _imprimir(resultados)
+    elif args.comando == "busca":
+        resultados = benchmark_busca(args.linhas, args.repeticoes)
+        _imprimir(resultados)
+    elif args.comando == "processos":
+        resultados = benchmark_processos(args.linhas, args.processos, args.duracao)
+        _imprimir_processos(resultados)
+    else:
+        resultados = benchmark_carga(args.linhas, args.lideres, args.funcionarios, args.duracao, not args.sem_cas)
+        _imprimir_carga(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"comando": args.comando, "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()